@@ -0,0 +1,500 @@
+#!/usr/bin/env python3
+import argparse
+import collections
+import gc
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import time
+import descriptors
+import libtxsize
+from libtxsize import normalize, parse, tx_est, tx_measure
+
+BENCHMARK_SIZES = (1, 10, 100, 1000, 10000)   # number of inputs per tx_est case
+INPUT_MIX = ('P2PKH', 'P2SH-2-of-3-multisig', 'P2SH-P2WPKH', 'P2WPKH',
+             'P2WSH-2-of-3-multisig', 'P2TR-keypath')
+OUTPUT_MIX = ('P2PKH', 'P2SH', 'P2WPKH', 'P2WSH', 'P2TR', 'NULLDATA-40')
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+REGRESSION_THRESHOLD = 0.25     # relative slowdown over the baseline flagged as regression
+MIN_TIME = 0.02                 # seconds per timing repetition
+REPEAT = 5
+
+# Benchmarks
+
+def measure(func, repeat=REPEAT, min_time=MIN_TIME):
+    # best-of-repeat seconds per call, with the number of calls per repetition
+    # doubled until a repetition takes at least min_time; like timeit, the
+    # garbage collector is disabled while timing
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _measure(func, repeat, min_time)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+def _measure(func, repeat, min_time):
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number *= 2
+    best = elapsed
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, time.perf_counter() - start)
+    return best / number
+
+def cases(sizes=BENCHMARK_SIZES):
+    # (name, callable) for every benchmark case
+    types = sorted(set(INPUT_MIX + OUTPUT_MIX), key=(INPUT_MIX + OUTPUT_MIX).index)
+    for txout_type in types:
+        yield f'parse[{txout_type}]', lambda t=txout_type: parse(t)
+        # uncached: the cost of a miss in the parse cache
+        yield f'parse_uncached[{txout_type}]', lambda t=txout_type: libtxsize._parse_spec(normalize(t))
+    for txout_type in INPUT_MIX:
+        yield f'input_est[{txout_type}]', lambda t=txout_type: libtxsize.input_est(t)
+        yield f'witness_est[{txout_type}]', lambda t=txout_type: libtxsize.witness_est(t)
+    for txout_type in OUTPUT_MIX:
+        yield f'output_est[{txout_type}]', lambda t=txout_type: libtxsize.output_est(t)
+    outputs = ['P2WPKH', 'P2TR']
+    for size in sizes:
+        for txout_type in INPUT_MIX:
+            inputs = [txout_type] * size
+            yield f'tx_est[{txout_type} x {size}]', lambda i=inputs: tx_est(i, outputs)
+        inputs = list(itertools.islice(itertools.cycle(INPUT_MIX), size))
+        yield f'tx_est[mixed x {size}]', lambda i=inputs: tx_est(i, outputs)
+
+def run_benchmarks(sizes=BENCHMARK_SIZES, repeat=REPEAT, min_time=MIN_TIME):
+    # machine-readable results: environment and seconds per call per case
+    results = {name: measure(func, repeat, min_time) for name, func in cases(sizes)}
+    return {'environment': {'python': platform.python_version(),
+                            'implementation': platform.python_implementation(),
+                            'machine': platform.machine(),
+                            'numpy': libtxsize.numpy is not None},
+            'results': results}
+
+def load_baseline(path=BASELINE):
+    with open(path) as f:
+        return json.load(f)
+
+def save_baseline(res, path=BASELINE):
+    # also used for --output files, which additionally contain the comparison
+    with open(path, 'w') as f:
+        json.dump(res, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+def compare(res, baseline, threshold=REGRESSION_THRESHOLD):
+    # per case present in both: baseline and current seconds per call, their
+    # ratio, and whether the slowdown exceeds threshold
+    rows = []
+    for name, seconds in res['results'].items():
+        if name not in baseline['results']:
+            continue
+        reference = baseline['results'][name]
+        ratio = seconds / reference
+        rows.append({'case': name, 'baseline': reference, 'current': seconds,
+                     'ratio': ratio, 'regression': ratio > 1 + threshold})
+    return rows
+
+# Differential validation
+
+def compact_size(num):
+    if num < 0xFD:
+        return bytes([num])
+    if num <= 0xFFFF:
+        return b'\xfd' + num.to_bytes(2, 'little')
+    if num <= 0xFFFFFFFF:
+        return b'\xfe' + num.to_bytes(4, 'little')
+    return b'\xff' + num.to_bytes(8, 'little')
+
+def push(data):
+    # minimal push of data onto the script stack
+    if not data:
+        return b'\x00'
+    if len(data) <= 0x4B:
+        return bytes([len(data)]) + data
+    if len(data) <= 0xFF:
+        return b'\x4c' + bytes([len(data)]) + data
+    if len(data) <= 0xFFFF:
+        return b'\x4d' + len(data).to_bytes(2, 'little') + data
+    return b'\x4e' + len(data).to_bytes(4, 'little') + data
+
+# dummy keys and signatures of the sizes the library assumes; ECDSA signatures
+# start with the DER sequence tag, compressed pubkeys with their parity byte
+def ecdsa_sig():
+    return b'\x30' + bytes(libtxsize.ECDSA_SIG - 1)
+
+def schnorr_sig():
+    return bytes(libtxsize.SCHNORR_SIG)
+
+PUBKEY = b'\x02' + bytes(libtxsize.ECDSA_PUBKEY - 1)
+
+def multisig_script(m, n):
+    # OP_m <pubkey 1> ... <pubkey n> OP_n OP_CHECKMULTISIG
+    return bytes([0x50 + m]) + push(PUBKEY) * n + bytes([0x50 + n, 0xAE])
+
+def serialize_output(txout_type):
+    # scriptPubKey of txout_type
+    data = parse(txout_type)
+    kind = data['txout_type']
+    if kind == 'P2PK':
+        return push(PUBKEY) + b'\xac'
+    if kind == 'P2PKH':
+        return b'\x76\xa9\x14' + bytes(20) + b'\x88\xac'
+    if kind == 'MULTISIG':
+        return multisig_script(data['m'], data['n'])
+    if kind in ('P2SH', 'P2SH-MULTISIG', 'P2SH-P2WSH-MULTISIG', 'P2SH-P2WPKH'):
+        return b'\xa9\x14' + bytes(20) + b'\x87'
+    if kind == 'NULLDATA':
+        return b'\x6a' + push(bytes(data['payload']))
+    if kind == 'P2WPKH':
+        return b'\x00\x14' + bytes(20)
+    if kind in ('P2WSH', 'P2WSH-MULTISIG'):
+        return b'\x00\x20' + bytes(32)
+    if kind == 'P2TR':
+        return b'\x51\x20' + bytes(32)
+    raise NotImplementedError(f'cannot serialize output of type {txout_type}')
+
+def serialize_input(txout_type):
+    # scriptSig and witness stack spending txout_type
+    data = parse(txout_type)
+    kind = data['txout_type']
+    if kind == 'P2PK':
+        return push(ecdsa_sig()), []
+    if kind == 'P2PKH':
+        return push(ecdsa_sig()) + push(PUBKEY), []
+    if kind == 'MULTISIG':
+        return b'\x00' + push(ecdsa_sig()) * data['m'], []
+    if kind == 'P2SH-MULTISIG':
+        redeem_script = multisig_script(data['m'], data['n'])
+        return b'\x00' + push(ecdsa_sig()) * data['m'] + push(redeem_script), []
+    if kind == 'P2SH-P2WPKH':
+        return push(b'\x00\x14' + bytes(20)), [ecdsa_sig(), PUBKEY]
+    if kind == 'P2SH-P2WSH-MULTISIG':
+        witness_script = multisig_script(data['m'], data['n'])
+        return push(b'\x00\x20' + bytes(32)), [b''] + [ecdsa_sig()] * data['m'] + [witness_script]
+    if kind == 'P2WPKH':
+        return b'', [ecdsa_sig(), PUBKEY]
+    if kind == 'P2WSH-MULTISIG':
+        witness_script = multisig_script(data['m'], data['n'])
+        return b'', [b''] + [ecdsa_sig()] * data['m'] + [witness_script]
+    if kind == 'P2TR' and data.get('path') == 'key':
+        return b'', [schnorr_sig()]
+    if kind == 'P2TR' and 'script' in data:
+        # <stack items> <tapscript> <control block>
+        control_block = b'\xc0' + bytes(libtxsize.control_block(data['depth']) - 1)
+        return b'', [bytes(item) for item in data['stack']] + [bytes(data['script']), control_block]
+    raise NotImplementedError(f'cannot serialize input of type {txout_type}')
+
+def serialize(inputs, outputs):
+    # dummy transaction with exactly the given input and output types
+    spends = [serialize_input(txout_type) for txout_type in inputs]
+    segwit = any(stack for _, stack in spends)
+    raw = bytearray((2).to_bytes(4, 'little'))
+    if segwit:
+        raw += b'\x00\x01'
+    raw += compact_size(len(inputs))
+    for num, (script_sig, _) in enumerate(spends):
+        raw += bytes(32) + num.to_bytes(4, 'little') + compact_size(len(script_sig)) + script_sig
+        raw += b'\xff\xff\xff\xff'
+    raw += compact_size(len(outputs))
+    for txout_type in outputs:
+        script = serialize_output(txout_type)
+        raw += (1000).to_bytes(8, 'little') + compact_size(len(script)) + script
+    if segwit:
+        for _, stack in spends:
+            raw += compact_size(len(stack))
+            for item in stack:
+                raw += compact_size(len(item)) + item
+    raw += bytes(4)
+    return bytes(raw)
+
+def expected_input_type(txout_type):
+    # normalized type tx_measure classifies a spend of txout_type as
+    data = parse(txout_type)
+    if data['txout_type'] == 'MULTISIG':
+        # n is not part of the input
+        return 'NONSTANDARD'
+    if data['txout_type'] == 'P2TR' and data.get('path') == 'script':
+        return 'P2TR-SCRIPTPATH'
+    return normalize(txout_type)
+
+def expected_output_type(txout_type):
+    # normalized type tx_measure classifies the scriptPubKey of txout_type as
+    data = parse(txout_type)
+    if data['txout_type'] in ('P2SH-MULTISIG', 'P2SH-P2WSH-MULTISIG', 'P2SH-P2WPKH'):
+        return 'P2SH'
+    if data['txout_type'] == 'P2WSH-MULTISIG':
+        return 'P2WSH'
+    if data['txout_type'] == 'P2TR':
+        return 'P2TR'
+    return normalize(txout_type)
+
+def serializable_types():
+    # supported types whose inputs and outputs, respectively, can be
+    # serialized; independent of the estimators, so that types the estimators
+    # reject show up as failures
+    inputs, outputs = [], []
+    for name in libtxsize.supported_types():
+        data = parse(name)
+        if 'MULTISIG' in data['txout_type'] and data['m'] > data['n']:
+            # accepted by parse(), but not a valid script
+            continue
+        for serializer, types in ((serialize_input, inputs), (serialize_output, outputs)):
+            try:
+                serializer(name)
+            except NotImplementedError:
+                continue
+            types.append(name)
+    return inputs, outputs
+
+def random_count(rng):
+    # mostly small counts, sometimes around the compact size boundary at 253
+    if rng.random() < 0.05:
+        return rng.randint(0xFD - 3, 0xFD + 3)
+    return rng.randint(1, 5)
+
+def random_tapscript(rng):
+    # script path spend with random leaf script size, depth, and stack items,
+    # including sizes around the compact size boundary
+    script = rng.choice((1, 34, 0xFC, 0xFD, rng.randint(1, 600)))
+    depth = rng.choice((0, 1, rng.randint(0, libtxsize.TAPROOT_MAX_DEPTH)))
+    stack = [rng.choice((0, 1, 64, 0xFC, 0xFD, rng.randint(0, 600))) for _ in range(rng.randint(0, 4))]
+    return '-'.join(['P2TR-SCRIPTPATH', str(script), str(depth)] + [str(item) for item in stack])
+
+def random_shape(rng, input_types, output_types):
+    # random input and output types; about a third of the shapes are legacy
+    # transactions
+    if rng.random() < 0.3:
+        input_types = [name for name in input_types
+                       if libtxsize.witness_est(name).size is None] or input_types
+    inputs = [random_tapscript(rng) if rng.random() < 0.05 else rng.choice(input_types)
+              for _ in range(random_count(rng))]
+    outputs = [rng.choice(output_types) for _ in range(random_count(rng))]
+    return inputs, outputs
+
+def check(inputs, outputs):
+    # mismatches between tx_est and the measurement of the serialized shape
+    measured = tx_measure(serialize(inputs, outputs))
+    try:
+        estimate = tx_est(inputs, outputs)
+    except (ValueError, NotImplementedError, TypeError) as e:
+        return [{'error': f'{type(e).__name__}: {e}'}]
+    mismatches = []
+    for part in ('total', 'inputs', 'witnesses', 'outputs', 'overhead'):
+        if estimate[part] != measured[part]:
+            mismatches.append({'part': part, 'estimate': dict(estimate[part]),
+                               'measured': dict(measured[part])})
+    for part, estimator, types, measured_types, expected in (
+            ('inputs', libtxsize.input_est, inputs, measured['input_types'], expected_input_type),
+            ('witnesses', libtxsize.witness_est, inputs, measured['input_types'], None),
+            ('outputs', libtxsize.output_est, outputs, measured['output_types'], expected_output_type)):
+        for num, txout_type in enumerate(types):
+            part_estimate = estimator(txout_type)
+            if part_estimate != measured['parts'][part][num]:
+                mismatches.append({'part': f'{part}[{num}]', 'type': txout_type,
+                                   'estimate': dict(part_estimate),
+                                   'measured': dict(measured['parts'][part][num])})
+            if expected and normalize(measured_types[num]) != expected(txout_type):
+                mismatches.append({'part': f'{part}[{num}]', 'type': txout_type,
+                                   'classified': measured_types[num]})
+    return mismatches + check_paths(inputs, outputs, estimate)
+
+def descriptor(txout_type):
+    # descriptor with the same input, witness, and output sizes as txout_type,
+    # or None
+    data = parse(txout_type)
+    key, xonly_key = PUBKEY.hex(), PUBKEY[1:].hex()
+    if data['txout_type'] == 'P2TR':
+        return f'tr({xonly_key})' if data.get('path') != 'script' else None
+    if 'MULTISIG' in data['txout_type']:
+        multi = f"multi({data['m']},{','.join([key] * data['n'])})"
+        return {'MULTISIG': '{}', 'P2SH-MULTISIG': 'sh({})', 'P2WSH-MULTISIG': 'wsh({})',
+                'P2SH-P2WSH-MULTISIG': 'sh(wsh({}))'}[data['txout_type']].format(multi)
+    template = {'P2PK': 'pk({})', 'P2PKH': 'pkh({})', 'P2WPKH': 'wpkh({})',
+                'P2SH-P2WPKH': 'sh(wpkh({}))'}.get(data['txout_type'])
+    return template.format(key) if template else None
+
+def linear_max_count(txout_type, side, inputs, outputs, max_weight):
+    # max_count by adding one input or output at a time
+    fixed = collections.Counter(inputs if side == 'input' else outputs)
+    count = 0
+    while True:
+        variable = fixed + collections.Counter({txout_type: count + 1})
+        counts = (variable, collections.Counter(outputs)) if side == 'input' else \
+                 (collections.Counter(inputs), variable)
+        if libtxsize.tx_est_counts(*counts)['total']['weight'] > max_weight:
+            return count
+        count += 1
+
+def check_paths(inputs, outputs, estimate):
+    # mismatches between tx_est and the other estimators for the same shape;
+    # random choices are seeded by the shape so that shrink() reproduces them
+    rng = random.Random(repr((inputs, outputs)))
+    mismatches = []
+
+    def compare(path, other, parts=('total', 'inputs', 'witnesses', 'outputs', 'overhead')):
+        for part in parts:
+            if dict(other[part]) != dict(estimate[part]):
+                mismatches.append({'path': path, 'part': part, 'estimate': dict(estimate[part]),
+                                   'other': dict(other[part])})
+
+    compare('tx_est_counts', libtxsize.tx_est_counts(collections.Counter(inputs),
+                                                     collections.Counter(outputs)))
+
+    # one column per input and output, so that repeated types are summed
+    batches = [('tx_est_batch', libtxsize.tx_est_batch)]
+    if libtxsize.numpy is not None:
+        batches.append(('tx_est_batch (Python)', libtxsize._tx_est_batch_python))
+    for path, batch in batches:
+        res = batch(inputs, [[1] * len(inputs)], outputs, [[1] * len(outputs)])
+        compare(path, {'total': {key: float(res[key][0]) if key == 'vsize' else int(res[key][0])
+                                 for key in ('size', 'weight', 'vsize')}}, parts=('total',))
+
+    # build up in random order, take a detour across the compact size
+    # boundary, and roll back
+    acc = libtxsize.TxSizeAccumulator()
+    items = [('input', txout_type) for txout_type in inputs] + \
+            [('output', txout_type) for txout_type in outputs]
+    rng.shuffle(items)
+    for side, txout_type in items:
+        (acc.add_input if side == 'input' else acc.add_output)(txout_type)
+    compare('TxSizeAccumulator', acc.estimate())
+    snapshot = acc.snapshot()
+    extra_input, extra_output = rng.choice(inputs), rng.choice(outputs)
+    count = rng.choice((1, max(1, 0xFD - len(outputs)), 0xFD))
+    acc.add_input(extra_input, 2)
+    acc.add_output(extra_output, count)
+    acc.remove_input(extra_input)
+    if dict(acc.estimate()['total']) != dict(tx_est(inputs + [extra_input], outputs + [extra_output] * count)['total']):
+        mismatches.append({'path': 'TxSizeAccumulator', 'part': 'total', 'added': [extra_input, extra_output, count]})
+    acc.remove_output(extra_output, count)
+    acc.remove_input(extra_input)
+    compare('TxSizeAccumulator (removed)', acc.estimate())
+    acc.add_output(extra_output, 0xFFFF)
+    acc.rollback(snapshot)
+    compare('TxSizeAccumulator (rollback)', acc.estimate())
+    if (acc.size, acc.weight, acc.vsize) != tuple(estimate['total'][key] for key in ('size', 'weight', 'vsize')):
+        mismatches.append({'path': 'TxSizeAccumulator', 'part': 'properties'})
+
+    # budgets allowing up to a few hundred more inputs or outputs
+    side = rng.choice(('input', 'output'))
+    txout_type = rng.choice(inputs if side == 'input' else outputs)
+    max_weight = estimate['total']['weight'] + rng.randint(0, 40000)
+    found = libtxsize.max_count(txout_type, side, inputs, outputs, max_weight=max_weight)
+    expected = linear_max_count(txout_type, side, inputs, outputs, max_weight)
+    if found != expected:
+        mismatches.append({'path': 'max_count', 'type': txout_type, 'side': side,
+                           'max_weight': max_weight, 'found': found, 'expected': expected})
+
+    input_descs, output_descs = [descriptor(name) for name in inputs], [descriptor(name) for name in outputs]
+    if None not in input_descs + output_descs:
+        compare('descriptors.tx_est', descriptors.tx_est(input_descs, output_descs))
+    return mismatches
+
+def shrink(inputs, outputs):
+    # drops inputs and outputs as long as the shape keeps failing
+    changed = True
+    while changed:
+        changed = False
+        for side in ('inputs', 'outputs'):
+            items = inputs if side == 'inputs' else outputs
+            for num in range(len(items) - 1, -1, -1):
+                if len(items) == 1:
+                    break
+                smaller = items[:num] + items[num+1:]
+                shape = (smaller, outputs) if side == 'inputs' else (inputs, smaller)
+                if check(*shape):
+                    items = smaller
+                    inputs, outputs = shape
+                    changed = True
+    return inputs, outputs
+
+def check_encodings():
+    # length() and varint() against the push and compact size encodings at
+    # their boundaries
+    mismatches = []
+    boundaries = (0, 0x4B, 0xFC, 0xFD, 0xFF, 0xFFFF, 0xFFFFFFFF)
+    for num in sorted({b + d for b in boundaries for d in (-1, 0, 1) if b + d >= 0}):
+        if num <= 0x10000:
+            encoded = len(push(b'\x01' * num)) - num
+            try:
+                estimated = libtxsize.length(num)
+            except ValueError:
+                estimated = None
+            if estimated != encoded:
+                mismatches.append({'function': 'length', 'bytes': num,
+                                   'estimate': estimated, 'encoded': encoded})
+        if libtxsize.varint(num) != len(compact_size(num)):
+            mismatches.append({'function': 'varint', 'bytes': num,
+                               'estimate': libtxsize.varint(num), 'encoded': len(compact_size(num))})
+    return mismatches
+
+def differential(num_cases=1000, seed=0, profiles=tuple(libtxsize.SIGNING_PROFILES)):
+    # compares tx_est against tx_measure for num_cases random shapes per
+    # signing profile; returns the failures with their shrunk shapes
+    failures = [{'encoding': mismatch} for mismatch in check_encodings()]
+    try:
+        for profile in profiles:
+            libtxsize.set_signing_profile(profile)
+            input_types, output_types = serializable_types()
+            rng = random.Random(seed)
+            for _ in range(num_cases):
+                inputs, outputs = random_shape(rng, input_types, output_types)
+                if check(inputs, outputs):
+                    inputs, outputs = shrink(inputs, outputs)
+                    failures.append({'profile': profile, 'inputs': inputs, 'outputs': outputs,
+                                     'mismatches': check(inputs, outputs)})
+    finally:
+        libtxsize.set_signing_profile('default')
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-o', '--output', type=str, metavar='FILE', help='Write benchmark results and baseline comparison (JSON) to FILE, or - for stdout')
+    parser.add_argument('--baseline', type=str, default=BASELINE, metavar='FILE', help='Baseline to compare against')
+    parser.add_argument('--save-baseline', action='store_true', help='Store the results as the new baseline')
+    parser.add_argument('-t', '--threshold', type=float, default=REGRESSION_THRESHOLD, help='Relative slowdown flagged as regression')
+    parser.add_argument('--sizes', type=int, nargs='+', default=BENCHMARK_SIZES, help='Numbers of inputs of the tx_est cases')
+    parser.add_argument('-d', '--differential', type=int, nargs='?', const=1000, metavar='N', help='Validate tx_est against N serialized random transactions per signing profile instead of benchmarking')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random transaction shapes')
+    args = parser.parse_args()
+
+    if args.differential is not None:
+        failures = differential(args.differential, args.seed)
+        for failure in failures:
+            print(json.dumps(failure))
+        print(f'{len(failures)} failures', file=sys.stderr)
+        sys.exit(1 if failures else 0)
+
+    res = run_benchmarks(args.sizes)
+    if args.save_baseline:
+        save_baseline(res, args.baseline)
+        return
+    rows = compare(res, load_baseline(args.baseline), args.threshold) if os.path.exists(args.baseline) else []
+    if args.output == '-':
+        json.dump({**res, 'comparison': rows}, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+    else:
+        if args.output:
+            save_baseline({**res, 'comparison': rows}, args.output)
+        baseline = {row['case']: row for row in rows}
+        for name, seconds in res['results'].items():
+            line = f'{name:<40} {seconds*1e6:12.3f} us'
+            if name in baseline:
+                line += f' {baseline[name]["ratio"]:7.2f}x' + (' REGRESSION' if baseline[name]['regression'] else '')
+            print(line)
+    sys.exit(1 if any(row['regression'] for row in rows) else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+import collections
+import mmap
+import multiprocessing
+import os
+import traceback
+from libtxsize import measure_at, read_varint, input_est, output_est, witness_est
+
+# network magic bytes prefixing each block in blk*.dat files
+MAGIC = {bytes.fromhex('f9beb4d9'): 'main',
+         bytes.fromhex('0b110907'): 'test',
+         bytes.fromhex('1c163f28'): 'testnet4',
+         bytes.fromhex('0a03cf40'): 'signet',
+         bytes.fromhex('fabfb5da'): 'regtest'}
+BLOCK_HEADER = 80
+
+ESTIMATORS = {'inputs': input_est, 'witnesses': witness_est, 'outputs': output_est}
+
+XOR_KEY = 'xor.dat'              # obfuscation key file in the blocks directory
+# (type prefix, output type) of input types whose outputs are classified as
+# the output type
+WRAPPED_OUTPUTS = (('P2SH-', 'P2SH'), ('P2WSH-', 'P2WSH'), ('P2TR-', 'P2TR'))
+
+def read_xor_key(path):
+    # block file obfuscation key of Bitcoin Core 28+ from xor.dat next to the
+    # block file; None if there is none or it is all zeros
+    key_path = os.path.join(os.path.dirname(os.path.abspath(path)), XOR_KEY)
+    try:
+        with open(key_path, 'rb') as f:
+            key = f.read()
+    except FileNotFoundError:
+        return None
+    return key if any(key) else None
+
+def unxor(data, key, offset):
+    # data read at file offset, de-obfuscated with the repeating key
+    if not key:
+        return data
+    start = offset % len(key)
+    stream = (key[start:] + key[:start]) * (len(data) // len(key) + 1)
+    value = int.from_bytes(data, 'little') ^ int.from_bytes(stream[:len(data)], 'little')
+    return value.to_bytes(len(data), 'little')
+
+def iter_blocks(view, key=None):
+    # (file offset, block) pairs of a blk*.dat file; blocks are zero-copy views
+    # unless the file is obfuscated with key
+    pos = 0
+    while pos + 8 <= len(view):
+        magic = bytes(unxor(view[pos:pos+4], key, pos))
+        if magic == b'\x00\x00\x00\x00':
+            # remainder of a preallocated file
+            return
+        if magic not in MAGIC:
+            raise ValueError(f'unknown network magic {magic.hex()} at offset {pos}'
+                             + ('' if key else f' (obfuscated block file without {XOR_KEY}?)'))
+        size = int.from_bytes(unxor(view[pos+4:pos+8], key, pos + 4), 'little')
+        pos += 8
+        if pos + size > len(view):
+            raise ValueError(f'truncated block at offset {pos}')
+        if key:
+            yield pos, memoryview(unxor(view[pos:pos+size], key, pos))
+        else:
+            yield pos, view[pos:pos+size]
+        pos += size
+
+def measure(view, pos, offset):
+    # measure_at, with the file offset of malformed transactions in errors
+    try:
+        return measure_at(view, pos)
+    except ValueError as e:
+        # drop the views into the file held by the failed frames, so that the
+        # file can be unmapped
+        traceback.clear_frames(e.__traceback__)
+        message = str(e)
+    raise ValueError(f'malformed transaction at offset {offset + pos}: {message}')
+
+def iter_block_transactions(block, offset=0):
+    num_txs, pos = read_varint(block, BLOCK_HEADER)
+    for _ in range(num_txs):
+        res, pos = measure(block, pos, offset)
+        yield res
+
+def iter_raw_transactions(view):
+    pos = 0
+    while pos < len(view):
+        res, pos = measure(view, pos, 0)
+        yield res
+
+def guarded(transactions, errors):
+    # reraises errors of transactions, or appends them to the errors list
+    try:
+        yield from transactions
+    except ValueError as e:
+        traceback.clear_frames(e.__traceback__)
+        if errors is None:
+            raise
+        errors.append(str(e))
+
+def iter_transactions(path, raw=False, errors=None):
+    # lazily yields tx_measure results for all transactions in a blk*.dat file
+    # (or, if raw is set, a file of concatenated serialized transactions); the
+    # file is memory-mapped, so only the pages being parsed need to be
+    # resident. Obfuscated block files are de-obfuscated with the xor.dat key
+    # in their directory. Malformed data raises ValueError with its file
+    # offset; if errors is a list, the messages are appended to it instead,
+    # and the rest of the block (or of the file, for raw files and malformed
+    # block framing) is skipped.
+    key = None if raw else read_xor_key(path)
+    with open(path, 'rb') as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file
+            return
+    with mapped:
+        view = memoryview(mapped)
+        try:
+            if raw:
+                yield from guarded(iter_raw_transactions(view), errors)
+            else:
+                blocks = guarded(iter_blocks(view, key), errors)
+                for offset, block in blocks:
+                    try:
+                        yield from guarded(iter_block_transactions(block, offset), errors)
+                    finally:
+                        block.release()
+        finally:
+            view.release()
+
+def new_stats():
+    # per (part, txout type): number of parts, sum of actual sizes, sum of
+    # estimated sizes and number of parts with an estimate, and histograms of
+    # actual sizes and of (actual - estimated) sizes; plus the messages of
+    # skipped malformed data
+    return {'transactions': {'count': 0, 'size': 0, 'weight': 0},
+            'types': {}, 'errors': []}
+
+def type_stats():
+    return {'count': 0, 'size': 0, 'estimated': 0, 'estimate': 0,
+            'sizes': collections.Counter(), 'deltas': collections.Counter()}
+
+def estimate(part, txout_type, cache):
+    key = (part, txout_type)
+    if key not in cache:
+        try:
+            cache[key] = ESTIMATORS[part](txout_type).size
+        except (ValueError, NotImplementedError, KeyError):
+            cache[key] = None
+    return cache[key]
+
+def add(stats, res, cache):
+    txs = stats['transactions']
+    txs['count'] += 1
+    txs['size'] += res['total'].size
+    txs['weight'] += res['total'].weight
+    parts = (('inputs', res['input_types']), ('witnesses', res['input_types']),
+             ('outputs', res['output_types']))
+    for part, txout_types in parts:
+        for txout_type, measured in zip(txout_types, res['parts'][part]):
+            size = measured.size
+            if size is None:
+                continue
+            key = (part, txout_type)
+            if key not in stats['types']:
+                stats['types'][key] = type_stats()
+            entry = stats['types'][key]
+            entry['count'] += 1
+            entry['size'] += size
+            entry['sizes'][size] += 1
+            est = estimate(part, txout_type, cache)
+            if est is not None:
+                entry['estimated'] += 1
+                entry['estimate'] += est
+                entry['deltas'][size - est] += 1
+
+def merge(stats, other):
+    for metric in stats['transactions']:
+        stats['transactions'][metric] += other['transactions'][metric]
+    for key, entry in other['types'].items():
+        if key not in stats['types']:
+            stats['types'][key] = type_stats()
+        for metric in entry:
+            stats['types'][key][metric] += entry[metric]
+    stats['errors'] += other['errors']
+    return stats
+
+def scan_file(path, raw=False):
+    stats = new_stats()
+    cache = {}
+    errors = []
+    for res in iter_transactions(path, raw, errors):
+        add(stats, res, cache)
+    stats['errors'] = [f'{path}: {error}' for error in errors]
+    return stats
+
+def _scan_file(args):
+    return scan_file(*args)
+
+def scan(paths, raw=False, jobs=1):
+    # aggregate statistics over all files, one file per worker at a time
+    stats = new_stats()
+    if jobs <= 1:
+        for path in paths:
+            merge(stats, scan_file(path, raw))
+        return stats
+    with multiprocessing.Pool(jobs) as pool:
+        for partial in pool.imap_unordered(_scan_file, [(path, raw) for path in paths]):
+            merge(stats, partial)
+    return stats
+
+def reference_parts(stats):
+    # REF_PARTS-style table from the most common actual size per part and type
+    names = {'inputs': 'input', 'witnesses': 'witness', 'outputs': 'output'}
+    na = {'size': 'N/A', 'vsize': 'N/A', 'weight': 'N/A'}
+    ref = {}
+    for (part, txout_type), entry in sorted(stats['types'].items(), key=lambda item: item[0][::-1]):
+        if txout_type == 'NONSTANDARD':
+            continue
+        if txout_type not in ref:
+            ref[txout_type] = {name: dict(na) for name in names.values()}
+        size = entry['sizes'].most_common(1)[0][0]
+        if part == 'witnesses':
+            ref[txout_type]['witness'] = {'size': size, 'vsize': size/4, 'weight': size}
+        else:
+            ref[txout_type][names[part]] = {'size': size, 'vsize': size, 'weight': size*4}
+    # outputs of wrapped types are only seen as their script hash (or P2TR)
+    # outputs, so take their output sizes from those, which are not listed
+    # separately (like in REF_PARTS)
+    output_types = {output_type: ref.pop(output_type, None) for _, output_type in WRAPPED_OUTPUTS}
+    for txout_type, parts in ref.items():
+        for prefix, output_type in WRAPPED_OUTPUTS:
+            if txout_type.startswith(prefix) and output_types[output_type]:
+                parts['output'] = dict(output_types[output_type]['output'])
+                break
+    return ref
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+import bisect
+import math
+import random
+import time
+from libtxsize import TxSizeAccumulator, input_est, output_est, witness_est, SEGWIT_OVERHEAD
+
+BNB_MAX_TRIES   = 100000        # cf. Bitcoin Core's TOTAL_TRIES
+MIN_CHANGE      = 546           # smaller change is added to the fee instead
+
+def fee(feerate, weight):
+    # feerate in sat/vB
+    return math.ceil(feerate * weight / 4)
+
+def input_weight(txout_type):
+    # weight of spending txout_type as part of a segwit transaction, i.e.,
+    # including the empty witness of inputs without witness data
+    weight = input_est(txout_type).weight
+    if weight is None:
+        raise ValueError(f'txout type {txout_type} cannot be spent')
+    witness_weight = witness_est(txout_type).weight
+    return weight + (witness_weight if witness_weight is not None else 1)
+
+def candidate_pool(utxos, feerate, long_term_feerate):
+    # (effective value, input weight, input waste, utxo) for every utxo with a
+    # positive effective value, by descending effective value. Weights and
+    # fees are computed once per txout type.
+    per_type = {}
+    pool = []
+    for utxo in utxos:
+        txout_type = utxo['txout_type']
+        if txout_type not in per_type:
+            weight = input_weight(txout_type)
+            per_type[txout_type] = (weight, fee(feerate, weight),
+                                    fee(feerate, weight) - fee(long_term_feerate, weight))
+        weight, input_fee, input_waste = per_type[txout_type]
+        effective_value = utxo['value'] - input_fee
+        if effective_value > 0:
+            pool.append((effective_value, weight, input_waste, utxo))
+    pool.sort(key=lambda candidate: (-candidate[0], candidate[1]))
+    return pool
+
+def branch_and_bound(pool, target, cost_of_change, waste_pruning, max_tries=BNB_MAX_TRIES):
+    # depth-first search for a changeless selection with an effective value in
+    # [target, target + cost_of_change] and minimal waste; returns pool indices
+    num = len(pool)
+    # suffix[i] is the effective value of all candidates from i onwards, i.e.,
+    # the most the undecided part of the search tree can still contribute
+    suffix = [0] * (num + 1)
+    for i in range(num - 1, -1, -1):
+        suffix[i] = suffix[i + 1] + pool[i][0]
+    if suffix[0] < target:
+        return None
+
+    upper = target + cost_of_change
+    best, best_waste = None, None
+    selected = []
+    value = waste = 0
+    i = 0
+    for _ in range(max_tries):
+        backtrack = False
+        if value + suffix[i] < target or value > upper:
+            backtrack = True
+        elif waste_pruning and best_waste is not None and waste > best_waste:
+            # input waste only grows with more inputs
+            backtrack = True
+        elif value >= target:
+            if best_waste is None or waste + value - target <= best_waste:
+                best, best_waste = list(selected), waste + value - target
+            backtrack = True
+
+        if backtrack:
+            if not selected:
+                break
+            # continue with the branch omitting the last selected candidate,
+            # skipping candidates equivalent to it
+            j = selected.pop()
+            value -= pool[j][0]
+            waste -= pool[j][2]
+            i = j + 1
+            while i < num and pool[i][0] == pool[j][0] and pool[i][1] == pool[j][1]:
+                i += 1
+            continue
+
+        selected.append(i)
+        value += pool[i][0]
+        waste += pool[i][2]
+        i += 1
+
+    return best
+
+def greedy(pool, target):
+    # largest-first until target is reached
+    selected, value = [], 0
+    for i, candidate in enumerate(pool):
+        if value >= target:
+            break
+        selected.append(i)
+        value += candidate[0]
+    return selected if value >= target else None
+
+def lowest_larger(pool, target):
+    # single smallest candidate covering target
+    ascending = [-candidate[0] for candidate in pool]
+    i = bisect.bisect_right(ascending, -target)
+    return [i - 1] if i > 0 else None
+
+def finalize(pool, indices, targets, feerate, change_type, min_change):
+    # exact fee and change for the selection, or None if the estimate used
+    # during selection turned out to be too optimistic
+    acc = TxSizeAccumulator(outputs=[target['txout_type'] for target in targets])
+    inputs = [pool[i][3] for i in indices]
+    for utxo in inputs:
+        acc.add_input(utxo['txout_type'])
+    total = sum(utxo['value'] for utxo in inputs)
+    amount = sum(target['value'] for target in targets)
+
+    acc.add_output(change_type)
+    change = total - amount - fee(feerate, acc.weight)
+    if change < min_change:
+        acc.remove_output(change_type)
+        change = 0
+    tx_fee = total - amount - change
+    if tx_fee < fee(feerate, acc.weight):
+        return None
+    return {'inputs': inputs, 'change': change, 'fee': tx_fee,
+            'weight': acc.weight, 'vsize': acc.vsize}
+
+def select_coins(utxos, targets, feerate, change_type, long_term_feerate=None,
+                 min_change=MIN_CHANGE, max_tries=BNB_MAX_TRIES):
+    # utxos and targets are lists of dicts with (at least) the keys
+    # 'txout_type' and 'value' (in sat), feerate is in sat/vB. Returns a dict
+    # with the selected 'inputs', the 'change' value (0 for changeless
+    # selections), the 'fee', 'weight', 'vsize', and 'waste' of the
+    # transaction, and the 'algorithm' that found the selection.
+    if long_term_feerate is None:
+        long_term_feerate = feerate
+    pool = candidate_pool(utxos, feerate, long_term_feerate)
+
+    # fee for everything but the inputs, assuming a segwit transaction
+    acc = TxSizeAccumulator(outputs=[target['txout_type'] for target in targets])
+    base_weight = acc.weight + SEGWIT_OVERHEAD
+    target = sum(t['value'] for t in targets) + fee(feerate, base_weight)
+    change_fee = fee(feerate, output_est(change_type).weight)
+    cost_of_change = change_fee + fee(long_term_feerate, input_weight(change_type))
+
+    candidates = []
+    bnb = branch_and_bound(pool, target, cost_of_change,
+                           feerate > long_term_feerate, max_tries)
+    if bnb is not None:
+        candidates.append(('bnb', bnb))
+    for algorithm, selector in (('lowest_larger', lowest_larger), ('greedy', greedy)):
+        indices = selector(pool, target + change_fee + min_change)
+        if indices is None:
+            indices = selector(pool, target)
+        if indices is not None:
+            candidates.append((algorithm, indices))
+
+    best = None
+    for algorithm, indices in candidates:
+        res = finalize(pool, indices, targets, feerate, change_type, min_change)
+        if res is None:
+            continue
+        waste = sum(pool[i][2] for i in indices)
+        if res['change']:
+            waste += cost_of_change
+        else:
+            waste += sum(pool[i][0] for i in indices) - target
+        res['waste'] = waste
+        res['algorithm'] = algorithm
+        if best is None or waste < best['waste']:
+            best = res
+
+    if best is None:
+        raise ValueError('insufficient funds')
+    return best
+
+def benchmark(pool_sizes=(1000, 10000, 50000), seed=0, feerate=10):
+    # deterministic selection latency per utxo pool size
+    types = ['P2WPKH', 'P2TR-keypath', 'P2PKH', 'P2SH-P2WPKH', 'P2WSH-2-of-3-multisig']
+    res = []
+    for pool_size in pool_sizes:
+        rng = random.Random(seed)
+        utxos = [{'txout_type': rng.choice(types),
+                  'value': int(rng.lognormvariate(11, 2)) + 1}
+                 for _ in range(pool_size)]
+        targets = [{'txout_type': 'P2WPKH', 'value': 2_000_000},
+                   {'txout_type': 'P2TR', 'value': 350_000}]
+        start = time.perf_counter()
+        selection = select_coins(utxos, targets, feerate, 'P2WPKH')
+        res.append({'pool_size': pool_size,
+                    'seconds': time.perf_counter() - start,
+                    'algorithm': selection['algorithm'],
+                    'inputs': len(selection['inputs']),
+                    'waste': selection['waste']})
+    return res
+
+if __name__ == '__main__':
+    for row in benchmark():
+        print(f'{row["pool_size"]:>8} UTXOs: {row["seconds"]*1000:9.2f} ms '
+              f'({row["algorithm"]}, {row["inputs"]} inputs, waste {row["waste"]})')
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+import collections
+import functools
+import re
+import libtxsize
+from libtxsize import varint, length, tapscript_witness, tx_totals, Estimate, ReadOnlyDict, legacy_estimate, \
+    witness_estimate, INPUT_OVERHEAD, OUTPUT_OVERHEAD
+
+PLAN_CACHE_SIZE = 4096
+
+HEX_KEY = re.compile(r'^[0-9a-fA-F]+$')
+BASE58 = '[1-9A-HJ-NP-Za-km-z]'
+# [fingerprint/path] key origin
+KEY_ORIGIN = re.compile(r"^\[[0-9a-fA-F]{8}(/\d+['h]?)*\]")
+# xpub/xprv/tpub/tprv with optional derivation steps, including a final
+# wildcard and <a;b> multipath steps
+EXTENDED_KEY = re.compile(rf"^[xt]p(ub|rv){BASE58}{{107}}(/(\d+['h]?|<\d+(;\d+)+>))*(/\*['h]?)?$")
+# WIF private keys of compressed and uncompressed public keys (mainnet and
+# testnet)
+COMPRESSED_WIF = re.compile(rf'^[KLc]{BASE58}{{51}}$')
+UNCOMPRESSED_WIF = re.compile(rf'^[59]{BASE58}{{50}}$')
+KEY_SIZES = {'compressed': 33, 'uncompressed': 65}
+PLACEHOLDER_KEYS = {'compressed': '02' + '00'*32, 'uncompressed': '04' + '00'*64, 'xonly': '00'*32}
+# arguments that are not subexpressions: key expressions and thresholds
+KEY_ARG = re.compile(r'(?<=[(,{])\s*([^(),{}]*?)\s*(?=[),}])')
+MULTI = ('multi', 'sortedmulti')
+MULTI_A = ('multi_a', 'sortedmulti_a')
+
+# Descriptors are parsed into nested (name, args) tuples. Arguments are
+# subexpressions, thresholds (int), or key sizes ('key', size), so that the
+# AST of a descriptor does not depend on its key material or derivation
+# indices.
+
+def split_args(text):
+    # splits at commas outside of parentheses, brackets, and braces
+    args, depth, start = [], 0, 0
+    for pos, char in enumerate(text):
+        if char in '([{':
+            depth += 1
+        elif char in ')]}':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            args.append(text[start:pos])
+            start = pos + 1
+    args.append(text[start:])
+    return [arg.strip() for arg in args]
+
+def key_type(key):
+    # 'compressed', 'uncompressed', or 'xonly': the public key a key
+    # expression resolves to. Private keys are not included in error messages.
+    origin = KEY_ORIGIN.match(key) if key.startswith('[') else None
+    if key.startswith('[') and not origin:
+        raise ValueError('invalid key origin')
+    if origin:
+        key = key[origin.end():]
+    if HEX_KEY.match(key) and len(key) in (64, 66, 130):
+        if len(key) == 64:
+            return 'xonly'
+        if len(key) == 66 and key[:2] in ('02', '03'):
+            return 'compressed'
+        if len(key) == 130 and key[:2] == '04':
+            return 'uncompressed'
+        raise ValueError(f'invalid public key: {key}')
+    if EXTENDED_KEY.match(key) or COMPRESSED_WIF.match(key):
+        return 'compressed'
+    if UNCOMPRESSED_WIF.match(key):
+        return 'uncompressed'
+    raise ValueError('invalid key expression')
+
+def key_size(key, xonly):
+    # size of the public key a key expression resolves to
+    kind = key_type(key)
+    if kind == 'xonly' and not xonly:
+        raise ValueError('x-only public key outside of tr()')
+    if kind == 'uncompressed' and xonly:
+        raise ValueError('uncompressed public key in tr()')
+    return 32 if xonly else KEY_SIZES[kind]
+
+def strip_keys(desc):
+    # descriptor (without checksum) with every valid key expression replaced
+    # by a placeholder key of the same type, so that the parse cache neither
+    # holds key material nor misses for every derivation index. Invalid keys
+    # are left for the parser to reject.
+    def placeholder(match):
+        arg = match.group(1)
+        if arg.isdigit() and len(arg) < 64:
+            # threshold
+            return arg
+        try:
+            return PLACEHOLDER_KEYS[key_type(arg)]
+        except ValueError:
+            return arg
+    return KEY_ARG.sub(placeholder, desc.strip().split('#')[0])
+
+def parse_expr(text, xonly=False):
+    match = re.match(r'^([a-z_]+)\((.*)\)$', text, re.DOTALL)
+    if not match:
+        raise ValueError(f'invalid descriptor expression: {text}')
+    name, args = match.group(1), split_args(match.group(2))
+
+    if name in ('pk', 'pkh', 'wpkh'):
+        if len(args) != 1:
+            raise ValueError(f'{name}() takes exactly one key')
+        return (name, (('key', key_size(args[0], xonly)),))
+    if name in MULTI + MULTI_A:
+        if len(args) < 2:
+            raise ValueError(f'{name}() requires a threshold and at least one key')
+        k = int(args[0])
+        keys = tuple(('key', key_size(key, xonly)) for key in args[1:])
+        if not 1 <= k <= len(keys):
+            raise ValueError(f'threshold {k} not in range 1 to {len(keys)}')
+        return (name, (k,) + keys)
+    if name in ('sh', 'wsh'):
+        if len(args) != 1:
+            raise ValueError(f'{name}() takes exactly one expression')
+        return (name, (parse_expr(args[0]),))
+    if name == 'tr':
+        if len(args) not in (1, 2):
+            raise ValueError('tr() takes a key and an optional script tree')
+        internal = ('key', key_size(args[0], True))
+        if len(args) == 1:
+            return (name, (internal,))
+        return (name, (internal, parse_tree(args[1])))
+    raise NotImplementedError(f'unsupported descriptor function: {name}()')
+
+def parse_tree(text):
+    # tapscript tree: a leaf expression or {tree,tree}
+    if text.startswith('{') and text.endswith('}'):
+        branches = split_args(text[1:-1])
+        if len(branches) != 2:
+            raise ValueError(f'invalid script tree: {text}')
+        return ('tree', tuple(parse_tree(branch) for branch in branches))
+    return parse_expr(text, xonly=True)
+
+def parse_descriptor(desc):
+    # strips the optional checksum
+    desc = desc.strip().split('#')[0]
+    return parse_expr(desc)
+
+def script(node):
+    # size of the script of a pk(), pkh(), or multi() expression, and the
+    # sizes of the stack items satisfying it (0 for an empty item)
+    name, args = node
+    sig = libtxsize.ECDSA_SIG
+    if name == 'pk':
+        # <len> <pubkey> OP_CHECKSIG
+        key = args[0][1]
+        return length(key) + key + 1, [sig]
+    if name == 'pkh':
+        # OP_DUP OP_HASH160 0x14 <20-byte hash> OP_EQUALVERIFY OP_CHECKSIG
+        return 1 + 1 + 1 + 20 + 1 + 1, [sig, args[0][1]]
+    if name in MULTI:
+        # OP_k <len> <pubkey 1> ... <len> <pubkey n> OP_n OP_CHECKMULTISIG
+        k, keys = args[0], args[1:]
+        script_size = 1 + sum(length(key[1]) + key[1] for key in keys) + 1 + 1
+        return script_size, [0] + [sig] * k
+    raise NotImplementedError(f'unsupported script expression: {name}()')
+
+def tapscript(node):
+    # size of a tapscript leaf and the sizes of the stack items satisfying it
+    name, args = node
+    sig = libtxsize.SCHNORR_SIG
+    if name == 'pk':
+        # <len> <x-only pubkey> OP_CHECKSIG
+        return 1 + 32 + 1, [sig]
+    if name in MULTI_A:
+        # <pubkey 1> OP_CHECKSIG <pubkey 2> OP_CHECKSIGADD ... <pubkey n>
+        # OP_CHECKSIGADD <k> OP_NUMEQUAL, satisfied by k signatures and n-k
+        # empty items (in reverse key order)
+        k, keys = args[0], args[1:]
+        threshold = 1 if k <= 16 else 1 + (k.bit_length() + 8) // 8
+        return len(keys) * (1 + 32 + 1) + threshold + 1, [sig] * k + [0] * (len(keys) - k)
+    raise NotImplementedError(f'unsupported tapscript expression: {name}()')
+
+def push_size(item):
+    # scriptSig push of an item; empty items are OP_0
+    return length(item) + item if item else 1
+
+def stack_size(items):
+    return varint(len(items)) + sum(varint(item) + item for item in items)
+
+def leaves(tree, depth=0):
+    if tree[0] == 'tree':
+        for branch in tree[1]:
+            yield from leaves(branch, depth + 1)
+    else:
+        yield tree, depth
+
+def compile_plan(ast):
+    # scriptPubKey, scriptSig, and witness sizes of the descriptor (witness
+    # None if the descriptor's inputs have no witness)
+    name, args = ast
+    plan = {'leaves': []}
+    if name in ('pk', 'pkh') or name in MULTI:
+        script_size, stack = script(ast)
+        plan.update(script_pubkey=script_size, script_sig=sum(push_size(i) for i in stack), witness=None)
+    elif name == 'wpkh':
+        plan.update(script_pubkey=1 + 1 + 20, script_sig=0,
+                    witness=stack_size([libtxsize.ECDSA_SIG, args[0][1]]))
+    elif name == 'wsh':
+        script_size, stack = script(args[0])
+        plan.update(script_pubkey=1 + 1 + 32, script_sig=0, witness=stack_size(stack + [script_size]))
+    elif name == 'sh':
+        inner_name, inner_args = args[0]
+        if inner_name == 'wpkh':
+            redeem_script = 1 + 1 + 20
+            witness = stack_size([libtxsize.ECDSA_SIG, inner_args[0][1]])
+        elif inner_name == 'wsh':
+            redeem_script = 1 + 1 + 32
+            script_size, stack = script(inner_args[0])
+            witness = stack_size(stack + [script_size])
+        else:
+            redeem_script, stack = script(args[0])
+            witness = None
+        script_sig = (0 if witness else sum(push_size(i) for i in stack)) + push_size(redeem_script)
+        plan.update(script_pubkey=1 + 1 + 20 + 1, script_sig=script_sig, witness=witness)
+    elif name == 'tr':
+        # key path spend; script path spends of the leaves are listed under
+        # 'leaves'
+        plan.update(script_pubkey=1 + 1 + 32, script_sig=0, witness=stack_size([libtxsize.SCHNORR_SIG]))
+        if len(args) == 2:
+            for leaf, depth in leaves(args[1]):
+                script_size, stack = tapscript(leaf)
+                plan['leaves'].append(ReadOnlyDict(script=script_size, depth=depth, stack=tuple(stack),
+                                                   witness=tapscript_witness(script_size, depth, stack)))
+    else:
+        raise NotImplementedError(f'unsupported top-level descriptor: {name}()')
+
+    input_size = varint(plan['script_sig']) + plan['script_sig'] + INPUT_OVERHEAD
+    output_size = varint(plan['script_pubkey']) + plan['script_pubkey'] + OUTPUT_OVERHEAD
+    plan['input'] = legacy_estimate(input_size)
+    plan['output'] = legacy_estimate(output_size)
+    plan['witness'] = witness_estimate(plan['witness']) if plan['witness'] is not None else Estimate.NA
+    # shared by all descriptors of the same structure (see plan())
+    plan['leaves'] = tuple(plan['leaves'])
+    return ReadOnlyDict(plan)
+
+@functools.lru_cache(maxsize=PLAN_CACHE_SIZE)
+def _compiled(ast, ecdsa_sig, schnorr_sig):
+    # keyed on the key-free AST and the signature sizes in use
+    return compile_plan(ast)
+
+@functools.lru_cache(maxsize=PLAN_CACHE_SIZE)
+def _ast(desc):
+    # keyed on the descriptor with its keys stripped (see strip_keys)
+    return parse_descriptor(desc)
+
+def plan(desc):
+    # size plan of a descriptor: the 'input', 'witness', and 'output'
+    # estimates (as returned by input_est, witness_est, and output_est), and
+    # for tr() descriptors with a script tree the script path spends of the
+    # leaves. Plans are shared by all descriptors with the same structure and
+    # key types, e.g., all indices of a range descriptor, and are therefore
+    # read-only: a ReadOnlyDict whose leaves are a tuple of ReadOnlyDicts.
+    return _compiled(_ast(strip_keys(desc)), libtxsize.ECDSA_SIG, libtxsize.SCHNORR_SIG)
+
+def cache_info():
+    return {'parse': _ast.cache_info(), 'plans': _compiled.cache_info()}
+
+def input_est(desc):
+    return plan(desc)['input']
+
+def output_est(desc):
+    return plan(desc)['output']
+
+def witness_est(desc):
+    return plan(desc)['witness']
+
+def tx_est(inputs, outputs):
+    # tx_est for lists of descriptors instead of txout types
+    inputs, outputs = collections.Counter(inputs), collections.Counter(outputs)
+    input_bytes = witness_bytes = output_bytes = no_witness_inputs = 0
+    for desc, count in inputs.items():
+        desc_plan = plan(desc)
+        input_bytes += count * desc_plan['input'].size
+        if desc_plan['witness'].applicable:
+            witness_bytes += count * desc_plan['witness'].size
+        else:
+            no_witness_inputs += count
+    for desc, count in outputs.items():
+        output_bytes += count * plan(desc)['output'].size
+    return tx_totals(sum(inputs.values()), sum(outputs.values()), input_bytes,
+                     witness_bytes, no_witness_inputs, output_bytes)
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import collections
+import json
+import time
+import urllib.parse
+from libtxsize import tx_est_counts, input_est, output_est, witness_est, normalize
+
+RESPONSE_CACHE_SIZE = 65536     # cached tx estimates
+LATENCY_SAMPLES     = 10000     # most recent request latencies kept per endpoint
+MAX_BODY            = 1 << 20   # largest accepted request body in bytes
+
+PART_ESTIMATORS = {'/input': input_est, '/output': output_est, '/witness': witness_est}
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large'}
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class EstimateService:
+    # Transaction estimates keyed on the canonical multiset of input and
+    # output types: identical concurrent requests share one computation, and
+    # results are kept in an LRU cache.
+    def __init__(self, cache_size=RESPONSE_CACHE_SIZE):
+        self.cache_size = cache_size
+        self.cache = collections.OrderedDict()
+        self.in_flight = {}
+        self.counters = collections.Counter()
+        self.latencies = collections.defaultdict(lambda: collections.deque(maxlen=LATENCY_SAMPLES))
+
+    @staticmethod
+    def key(inputs, outputs):
+        if not isinstance(inputs, list) or not isinstance(outputs, list) \
+                or not all(isinstance(t, str) for t in inputs + outputs):
+            raise HTTPError(400, 'inputs and outputs must be lists of types')
+        if not inputs or not outputs:
+            raise HTTPError(400, 'transaction estimates require at least one '
+                                 'input and one output')
+        return (tuple(sorted(collections.Counter(normalize(i) for i in inputs).items())),
+                tuple(sorted(collections.Counter(normalize(o) for o in outputs).items())))
+
+    async def tx_est(self, inputs, outputs):
+        key = self.key(inputs, outputs)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            self.counters['cache_hits'] += 1
+            return self.cache[key]
+        if key in self.in_flight:
+            self.counters['coalesced'] += 1
+            shared = self.in_flight[key]
+            # unlike awaiting the future, does not cancel it if this request
+            # is cancelled
+            await asyncio.wait([shared])
+            if shared.cancelled():
+                # the request computing it was cancelled; start over
+                return await self.tx_est(inputs, outputs)
+            return shared.result()
+
+        self.counters['cache_misses'] += 1
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        try:
+            res = await asyncio.get_running_loop().run_in_executor(
+                None, tx_est_counts, dict(key[0]), dict(key[1]))
+        except Exception as e:
+            future.set_exception(e)
+            # retrieved by waiters, if any; avoid "exception never retrieved"
+            future.exception()
+            raise
+        else:
+            future.set_result(res)
+        finally:
+            del self.in_flight[key]
+            if not future.done():
+                # this request was cancelled (e.g., at shutdown): release the
+                # coalesced waiters instead of leaving them hanging
+                future.cancel()
+        self.cache[key] = res
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return res
+
+    async def batch(self, records):
+        if not isinstance(records, list):
+            raise HTTPError(400, 'batch body must be a list of transactions')
+
+        async def one(record):
+            try:
+                return {'estimate': await self.tx_est(record['inputs'], record['outputs'])}
+            except HTTPError as e:
+                return {'error': str(e)}
+            except (ValueError, NotImplementedError, KeyError, TypeError, AttributeError) as e:
+                return {'error': f'{type(e).__name__}: {e}'}
+
+        return await asyncio.gather(*(one(record) for record in records))
+
+    def record(self, endpoint, seconds):
+        self.counters['requests'] += 1
+        self.latencies[endpoint].append(seconds)
+
+    def stats(self):
+        lookups = self.counters['cache_hits'] + self.counters['cache_misses']
+        latency = {}
+        for endpoint, samples in self.latencies.items():
+            ordered = sorted(samples)
+            latency[endpoint] = {
+                'count': len(ordered),
+                **{f'p{p}': ordered[min(len(ordered) - 1, len(ordered) * p // 100)] * 1000
+                   for p in (50, 90, 99)},
+                'max': ordered[-1] * 1000}
+        return {'requests': self.counters['requests'],
+                'cache_hits': self.counters['cache_hits'],
+                'cache_misses': self.counters['cache_misses'],
+                'cache_hit_rate': self.counters['cache_hits'] / lookups if lookups else None,
+                'cache_size': len(self.cache),
+                'coalesced': self.counters['coalesced'],
+                'latency_ms': latency}
+
+    async def dispatch(self, method, target, body):
+        url = urllib.parse.urlsplit(target)
+        path = url.path
+        if path in PART_ESTIMATORS:
+            if method != 'GET':
+                raise HTTPError(405, f'{path} requires GET')
+            query = urllib.parse.parse_qs(url.query)
+            if 'type' not in query:
+                raise HTTPError(400, 'missing query parameter: type')
+            return PART_ESTIMATORS[path](query['type'][0])
+        if path == '/stats':
+            return self.stats()
+        if path in ('/tx', '/batch'):
+            if method != 'POST':
+                raise HTTPError(405, f'{path} requires POST')
+            try:
+                data = json.loads(body or b'null')
+            except ValueError as e:
+                raise HTTPError(400, f'invalid JSON: {e}')
+            if path == '/batch':
+                return await self.batch(data)
+            if not isinstance(data, dict):
+                raise HTTPError(400, 'body must be an object with inputs and outputs')
+            return await self.tx_est(data.get('inputs'), data.get('outputs'))
+        raise HTTPError(404, f'unknown endpoint: {path}')
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                start = time.perf_counter()
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+
+                try:
+                    length = int(headers.get('content-length', 0) or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    # the body cannot be skipped without its length
+                    await self.respond(writer, 400, {'error': 'invalid Content-Length'}, False)
+                    break
+                if length > MAX_BODY:
+                    await self.respond(writer, 413, {'error': f'body exceeds {MAX_BODY} bytes'}, False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                try:
+                    status, res = 200, await self.dispatch(method, target, body)
+                except HTTPError as e:
+                    status, res = e.status, {'error': str(e)}
+                except (ValueError, NotImplementedError, KeyError, TypeError, AttributeError) as e:
+                    status, res = 400, {'error': f'{type(e).__name__}: {e}'}
+                await self.respond(writer, status, res, keep_alive)
+                self.record(urllib.parse.urlsplit(target).path, time.perf_counter() - start)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def respond(writer, status, res, keep_alive):
+        payload = json.dumps(res, default=dict).encode()
+        writer.write(f'HTTP/1.1 {status} {REASONS[status]}\r\n'
+                     f'Content-Type: application/json\r\n'
+                     f'Content-Length: {len(payload)}\r\n'
+                     f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode()
+                     + payload)
+        await writer.drain()
+
+async def serve(host='127.0.0.1', port=8080, cache_size=RESPONSE_CACHE_SIZE):
+    service = EstimateService(cache_size)
+    server = await asyncio.start_server(service.handle, host, port)
+    async with server:
+        await server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('-p', '--port', type=int, default=8080, help='Port to listen on')
+    parser.add_argument('-c', '--cache-size', type=int, default=RESPONSE_CACHE_SIZE, help='Number of cached transaction estimates')
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.cache_size))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+import collections
+import functools
+import time
+import timeit
+import libtxsize
+
+# Functions of libtxsize that are timed while instrumentation is enabled.
+# Instrumentation replaces them in the libtxsize module namespace, which also
+# covers calls made within the library; names imported into other modules
+# before enable() keep referring to the uninstrumented functions. While
+# disabled, the original functions are in place, so there is no overhead.
+INSTRUMENTED = ('parse', 'script_sig', 'script_pubkey', 'witness', 'varint',
+                'input_est', 'output_est', 'witness_est', 'tx_est', 'tx_est_counts')
+TIMING_SAMPLES = 10000          # most recent call durations kept per function
+
+_originals = {}
+_sinks = []
+_calls = collections.Counter()
+_seconds = collections.Counter()
+_samples = collections.defaultdict(lambda: collections.deque(maxlen=TIMING_SAMPLES))
+
+def instrument(name, func):
+    perf_counter = time.perf_counter
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            seconds = perf_counter() - start
+            _calls[name] += 1
+            _seconds[name] += seconds
+            _samples[name].append(seconds)
+            for sink in _sinks:
+                sink(name, seconds)
+    return wrapper
+
+def enabled():
+    return bool(_originals)
+
+def enable():
+    if enabled():
+        return
+    for name in INSTRUMENTED:
+        _originals[name] = getattr(libtxsize, name)
+        setattr(libtxsize, name, instrument(name, _originals[name]))
+
+def disable():
+    for name, func in _originals.items():
+        setattr(libtxsize, name, func)
+    _originals.clear()
+
+def reset():
+    _calls.clear()
+    _seconds.clear()
+    _samples.clear()
+
+def add_sink(callback):
+    # callback(name, seconds) is called after every instrumented call
+    _sinks.append(callback)
+
+def remove_sink(callback):
+    _sinks.remove(callback)
+
+def percentile(ordered, p):
+    return ordered[min(len(ordered) - 1, len(ordered) * p // 100)]
+
+def stats():
+    # per function: calls, cumulative seconds, and percentiles of the most
+    # recent call durations (in seconds); plus the library's cache hit ratios
+    functions = {}
+    for name in INSTRUMENTED:
+        if not _calls[name]:
+            continue
+        ordered = sorted(_samples[name])
+        functions[name] = {'calls': _calls[name], 'seconds': _seconds[name],
+                           'p50': percentile(ordered, 50), 'p90': percentile(ordered, 90),
+                           'p99': percentile(ordered, 99), 'max': ordered[-1]}
+    info = libtxsize.cache_info()
+    parse_lookups = info['parse'].hits + info['parse'].misses
+    estimate_lookups = info['estimates']['hits'] + info['estimates']['misses']
+    return {'functions': functions,
+            'caches': {'parse': info['parse'].hits / parse_lookups if parse_lookups else None,
+                       'estimates': info['estimates']['hits'] / estimate_lookups if estimate_lookups else None}}
+
+def prometheus_text():
+    # stats() in the Prometheus text exposition format
+    res = stats()
+    lines = ['# HELP libtxsize_calls_total Number of calls per function.',
+             '# TYPE libtxsize_calls_total counter']
+    for name, entry in res['functions'].items():
+        lines.append(f'libtxsize_calls_total{{function="{name}"}} {entry["calls"]}')
+    lines += ['# HELP libtxsize_seconds Call durations per function.',
+              '# TYPE libtxsize_seconds summary']
+    for name, entry in res['functions'].items():
+        for p in (50, 90, 99):
+            lines.append(f'libtxsize_seconds{{function="{name}",quantile="0.{p}"}} {entry[f"p{p}"]}')
+        lines.append(f'libtxsize_seconds_sum{{function="{name}"}} {entry["seconds"]}')
+        lines.append(f'libtxsize_seconds_count{{function="{name}"}} {entry["calls"]}')
+    lines += ['# HELP libtxsize_cache_hit_ratio Cache hit ratio per cache.',
+              '# TYPE libtxsize_cache_hit_ratio gauge']
+    for cache, ratio in res['caches'].items():
+        if ratio is not None:
+            lines.append(f'libtxsize_cache_hit_ratio{{cache="{cache}"}} {ratio}')
+    return '\n'.join(lines) + '\n'
+
+def overhead_benchmark(number=20000, repeat=5):
+    # best-of-repeat seconds per tx_est call before instrumentation was ever
+    # enabled in this measurement, while enabled, and after disabling again
+    inputs, outputs = ['P2WPKH', 'P2PKH', 'P2TR-keypath'], ['P2TR', 'P2WPKH']
+    was_enabled = enabled()
+    disable()
+
+    def measure():
+        return min(timeit.repeat(lambda: libtxsize.tx_est(inputs, outputs),
+                                 number=number, repeat=repeat)) / number
+
+    res = {'baseline': measure()}
+    enable()
+    res['enabled'] = measure()
+    disable()
+    res['disabled'] = measure()
+    if was_enabled:
+        enable()
+    return res
+
+if __name__ == '__main__':
+    res = overhead_benchmark()
+    for state in ('baseline', 'enabled', 'disabled'):
+        print(f'{state:>8}: {res[state]*1e6:8.3f} us per tx_est '
+              f'({res[state] / res["baseline"] - 1:+.1%})')
@@ -1,7 +1,11 @@
 #!/usr/bin/env python3
 import argparse
+import csv
+import itertools
+import json
+import multiprocessing
 import sys
-from libtxsize import tx_est, input_est, output_est, witness_est
+import libtxsize
 
 def main():
     parser = argparse.ArgumentParser()
@@ -9,16 +13,47 @@ def main():
     parser.add_argument('-i', '--inputs', type=str, required=False, default=None, action='store', help='Comma-separated list of inputs')
     parser.add_argument('-o', '--outputs', type=str, required=False, default=None, action='store', help='Comma-separated list of outputs')
     parser.add_argument('-s', '--sanity-check', action='store_true', help='Run sanity check')
+    parser.add_argument('--scan', type=str, nargs='+', default=None, metavar='FILE', help='Scan blk*.dat files for per-type size statistics (obfuscated files are read with the xor.dat key in their directory)')
+    parser.add_argument('--raw', action='store_true', help='Scanned files contain concatenated raw transactions')
+    parser.add_argument('--reference', action='store_true', help='Print scan results as reference data')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of worker processes')
+    parser.add_argument('-b', '--batch', type=str, nargs='?', const='-', default=None, metavar='FILE', help='Estimate transactions read from FILE (default: stdin), one per record')
+    parser.add_argument('-f', '--format', type=str, choices=['jsonl', 'csv'], default='jsonl', help='Batch input format')
+    parser.add_argument('-p', '--profile', action='store_true', help='Print a per-function timing breakdown')
     args = parser.parse_args()
 
     if len(sys.argv) < 2:
         parser.print_usage()
         return 1
 
+    if args.profile and args.jobs > 1:
+        # calls made in worker processes would not be counted
+        parser.error('--profile requires --jobs 1')
+
+    if args.profile:
+        import instrumentation
+        instrumentation.enable()
+        try:
+            return run(args)
+        finally:
+            instrumentation.disable()
+            print_profile(instrumentation.stats(), sys.stderr if args.batch else sys.stdout)
+
+    return run(args)
+
+def run(args):
     if args.sanity_check:
         sanity_check()
         return
 
+    if args.batch:
+        batch(args.batch, args.format, args.jobs)
+        return
+
+    if args.scan:
+        print_scan(args.scan, args.raw, args.jobs, args.reference)
+        return
+
     if not args.notx and (not args.inputs or not args.outputs):
         raise ValueError('Transaction estimates require at least one input '
                          'and one output.')
@@ -40,22 +75,22 @@ def print_estimate(inputs, outputs, notx):
     if inputs:
         table('INPUTS', {'size': '', 'weight': '', 'vsize': ''})
         for num, i in enumerate(inputs, 1):
-            table(f'{num}. {i}', input_est(i))
+            table(f'{num}. {i}', libtxsize.input_est(i))
         table_sep()
 
         table('WITNESSES', {'size': '', 'weight': '', 'vsize': ''})
         for num, i in enumerate(inputs, 1):
-            table(f'{num}. {i}', witness_est(i))
+            table(f'{num}. {i}', libtxsize.witness_est(i))
         table_sep()
 
     if outputs:
         table('OUTPUTS', {'size': '', 'weight': '', 'vsize': ''})
         for num, i in enumerate(outputs, 1):
-            table(f'{num}. {i}', output_est(i))
+            table(f'{num}. {i}', libtxsize.output_est(i))
         table_sep()
 
     if not notx:
-        res = tx_est(inputs, outputs)
+        res = libtxsize.tx_est(inputs, outputs)
         table('INPUT DATA', res['inputs'])
         table('WITNESS DATA', res['witnesses'])
         table('OUTPUT DATA', res['outputs'])
@@ -64,6 +99,116 @@ def print_estimate(inputs, outputs, notx):
         table('TRANSACTION TOTAL', res['total'])
         table_sep()
 
+# records per pool.map() call in batch mode; bounds the number of records
+# (and results) held in memory at any time
+BATCH_WINDOW = 4096
+
+def read_records(lines, fmt):
+    # yields (record number, raw record) pairs; for CSV, the first line is a
+    # header with (at least) the columns inputs and outputs, holding
+    # comma-separated lists as used by --inputs and --outputs
+    if fmt == 'csv':
+        for num, row in enumerate(csv.DictReader(lines), 1):
+            yield num, row
+    else:
+        for num, line in enumerate(lines, 1):
+            if line.strip():
+                yield num, line
+
+def batch_estimate(item):
+    num, record = item
+    res = {'record': num}
+    try:
+        if isinstance(record, str):
+            record = json.loads(record)
+            if not isinstance(record, dict):
+                raise TypeError('record must be an object with inputs and outputs')
+            inputs, outputs = record['inputs'], record['outputs']
+            for name, types in (('inputs', inputs), ('outputs', outputs)):
+                if not isinstance(types, list) or not all(isinstance(t, str) for t in types):
+                    raise TypeError(f'{name} must be a list of txout type strings')
+        else:
+            inputs = [i for i in (record['inputs'] or '').split(',') if i]
+            outputs = [o for o in (record['outputs'] or '').split(',') if o]
+        if 'id' in record:
+            res['id'] = record['id']
+        if not inputs or not outputs:
+            raise ValueError('Transaction estimates require at least one input '
+                             'and one output.')
+        res['estimate'] = libtxsize.tx_est(inputs, outputs)
+    except (ValueError, NotImplementedError, KeyError, TypeError, AttributeError) as e:
+        res['error'] = f'{type(e).__name__}: {e}'
+    return res
+
+def batch(path, fmt, jobs):
+    # streams one JSON line per record to stdout, in input order
+    lines = sys.stdin if path == '-' else open(path, newline='')
+    records = read_records(lines, fmt)
+    pool = multiprocessing.Pool(jobs) if jobs > 1 else None
+    try:
+        while True:
+            window = list(itertools.islice(records, BATCH_WINDOW))
+            if not window:
+                break
+            if pool:
+                results = pool.map(batch_estimate, window, chunksize=max(1, len(window) // (4 * jobs)))
+            else:
+                results = map(batch_estimate, window)
+            for res in results:
+                sys.stdout.write(json.dumps(res, default=dict) + '\n')
+            sys.stdout.flush()
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+        if lines is not sys.stdin:
+            lines.close()
+
+def print_scan(paths, raw, jobs, reference):
+    from blockscan import scan, reference_parts
+    stats = scan(paths, raw, jobs)
+    for error in stats['errors']:
+        print(f'skipped: {error}', file=sys.stderr)
+
+    if reference:
+        for txout_type, parts in reference_parts(stats).items():
+            print(f'REF_PARTS[{txout_type!r}] = {parts!r}')
+        return
+
+    sep = '+' + '-'*(45+2) + '+' + '-'*(11+2) + '+' + '-'*(11+2) + '+' + '-'*(11+2) + '+'
+    print(sep)
+    print(f'| {"Part/Type":<45} | {"count":>11} | {"avg [B]":>11} | {"avg err [B]":>11} |')
+    print(sep)
+    txs = stats['transactions']
+    print(f'| {"TRANSACTIONS":<45} | {txs["count"]:>11} | '
+          f'{round(txs["size"] / txs["count"], 2) if txs["count"] else "N/A":>11} | {"":>11} |')
+    print(sep)
+    for part in ('inputs', 'witnesses', 'outputs'):
+        print(f'| {part.upper():<45} | {"":>11} | {"":>11} | {"":>11} |')
+        for (entry_part, txout_type), entry in sorted(stats['types'].items()):
+            if entry_part != part:
+                continue
+            error = 'N/A'
+            if entry['estimated']:
+                error = round(sum(delta * count for delta, count in entry['deltas'].items()) / entry['estimated'], 2)
+            print(f'| {txout_type:<45} | {entry["count"]:>11} | '
+                  f'{round(entry["size"] / entry["count"], 2):>11} | {error:>11} |')
+        print(sep)
+
+def print_profile(stats, out):
+    sep = '+' + '-'*(33+2) + '+' + '-'*(11+2) + '+' + '-'*(11+2) + '+' + '-'*(11+2) + '+'
+    print(sep, file=out)
+    print(f'| {"Function":<33} | {"calls":>11} | {"total [ms]":>11} | {"p99 [us]":>11} |', file=out)
+    print(sep, file=out)
+    for name, entry in sorted(stats['functions'].items(), key=lambda item: -item[1]['seconds']):
+        print(f'| {name:<33} | {entry["calls"]:>11} | {entry["seconds"]*1e3:>11.3f} '
+              f'| {entry["p99"]*1e6:>11.2f} |', file=out)
+    print(sep, file=out)
+    for cache, ratio in stats['caches'].items():
+        ratio = f'{ratio:.2%}' if ratio is not None else 'N/A'
+        print(f'| {cache + " cache hit ratio":<33} | {"":>11} | {"":>11} | {ratio:>11} |', file=out)
+    print(sep, file=out)
+
 def table_sep():
     print('+' + '-'*(33+2) + '+' + '-'*(11+2) + '+' + '-'*(11+2) + '+' + '-'*(11+2) + '+')
 
@@ -74,9 +219,9 @@ def table(label, data):
 def sanity_check():
     from reference_data import REF_PARTS
     for txout_type in REF_PARTS:
-        estimate = {'output': output_est(txout_type),
-                    'input': input_est(txout_type),
-                    'witness': witness_est(txout_type)}
+        estimate = {'output': libtxsize.output_est(txout_type),
+                    'input': libtxsize.input_est(txout_type),
+                    'witness': libtxsize.witness_est(txout_type)}
         for metric in estimate:
             if estimate[metric] != REF_PARTS[txout_type][metric]:
                 raise AssertionError(f'{txout_type} {metric} estimate '
@@ -84,9 +229,13 @@ def sanity_check():
                                      f'{estimate[metric]} reference: '
                                      f'{REF_PARTS[txout_type][metric]})')
 
+    mismatches = libtxsize.check_type_table()
+    if mismatches:
+        raise AssertionError(f'type table does not match formulas: {mismatches}')
+
     from reference_data import REF_TXS
     for tx in REF_TXS:
-        estimate = tx_est(REF_TXS[tx]['inputs'], REF_TXS[tx]['outputs'])['total']
+        estimate = libtxsize.tx_est(REF_TXS[tx]['inputs'], REF_TXS[tx]['outputs'])['total']
         for metric in estimate:
             if estimate[metric] != REF_TXS[tx]['reference'][metric]:
                 raise AssertionError(f'tx {tx}: {metric} estimate '
@@ -1,7 +1,20 @@
 #!/usr/bin/env python3
 
+import array
+import collections
+import collections.abc
+import fractions
+import functools
+import heapq
+import math
+import numbers
 import re
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 TX_OVERHEAD     = 4 + 4         # 4-byte version, 4-byte locktime
 SEGWIT_OVERHEAD = 2             # 1-byte segwit marker and 1-byte segwit flag
 INPUT_OVERHEAD  = 32 + 4 + 4    # 32-byte txid, 4-byte pos, and 4-byte seq. no
@@ -23,20 +36,20 @@ def varint(num_bytes):
     raise ValueError(f'{num_bytes} exceeds maximum size of 2^64')
 
 def length(num_bytes):
-    if 0 <= num_bytes < 75:
+    if 0 <= num_bytes <= 0x4B:
         # direct encoding
         return 1
-    if 76 <= num_bytes < (2**(1*8))-1:
+    if 0x4B < num_bytes <= (2**(1*8))-1:
         # OP_PUSHDATA1
         return 1+1
-    if 2**(1*8) <= num_bytes < (2**(2*8))-1:
+    if 2**(1*8) <= num_bytes <= (2**(2*8))-1:
         # OP_PUSHDATA2
         return 1+2
-    if 2**(2*8) <= num_bytes < (2**(4*8))-1:
+    if 2**(2*8) <= num_bytes <= (2**(4*8))-1:
         # OP_PUSHDATA4
         return 1+4
 
-    raise ValueError(f'{num_bytes} not in supported range from 0 to 2^64-1')
+    raise ValueError(f'{num_bytes} not in supported range from 0 to 2^32-1')
 
 def witness(data):
     if data['txout_type'] == 'P2WPKH':
@@ -75,7 +88,11 @@ def witness(data):
             # 0x01 <itemlen> <Schnorr sig>
             return 1 + varint(SCHNORR_SIG) + SCHNORR_SIG
         if data['path'] == 'script':
-            raise NotImplementedError(f'P2TR script path not supported')
+            if 'script' not in data:
+                raise NotImplementedError('P2TR script path requires leaf script size, '
+                                          'Merkle depth, and stack items '
+                                          '(P2TR-scriptpath-<script>-<depth>[-<item>...])')
+            return tapscript_witness(data['script'], data['depth'], data['stack'])
         raise NotImplementedError(f'unknown P2TR path: {data["path"]}')
 
     if data['txout_type'] in ('P2PK', 'P2PKH', 'MULTISIG', 'P2SH-MULTISIG'):
@@ -87,6 +104,17 @@ def witness(data):
 
     raise NotImplementedError(f'unsupported txout type: {data["txout_type"]}')
 
+TAPROOT_MAX_DEPTH = 128        # cf. BIP 341
+
+def control_block(depth):
+    # <leaf version | parity> <internal key> <32-byte hash 1> ... <32-byte hash depth>
+    return 1 + SCHNORR_PUBKEY + 32 * depth
+
+def tapscript_witness(script_size, depth, stack):
+    # <nitems> <itemlen> <item 1> ... <itemlen> <tapscript> <itemlen> <control block>
+    items = list(stack) + [script_size, control_block(depth)]
+    return varint(len(items)) + sum(varint(item) + item for item in items)
+
 def script_pubkey(data):
     if data['txout_type'] == 'P2PK':
         # <len> <ECDSA pubkey> OP_CHECKSIG
@@ -172,97 +200,1159 @@ def multisig_check(m, n, max):
     if not 1 <= n <= max:
         raise ValueError('n = {n} (requirement is 1 <= n <= {max})')
 
-def parse(txout_type):
-    # Bare multi-signature
-    if re.match('^\d+-(?i)(of)-\d+-(?i)(Multisig)$', txout_type):
-        m, n = int(txout_type.split('-')[0]), int(txout_type.split('-')[2])
-        multisig_check(m, n, 3)
-        return {'txout_type': 'MULTISIG', 'm': m, 'n': n}
-
-    # P2SH multi-signature
-    if re.match('^(?i)(P2SH)-\d+-(?i)(of)-\d+-(?i)(Multisig)$', txout_type):
-        m, n = int(txout_type.split('-')[1]), int(txout_type.split('-')[3])
-        multisig_check(m, n, 16)
-        return {'txout_type': 'P2SH-MULTISIG', 'm': m, 'n': n}
-
-    # P2SH-P2WSH multi-signature
-    if re.match('^(?i)(P2SH)-(?i)(P2WSH)-\d+-(?i)(of)-\d+-(?i)(Multisig)$', txout_type):
-        m, n = int(txout_type.split('-')[2]), int(txout_type.split('-')[4])
-        multisig_check(m, n, 16)
-        return {'txout_type': 'P2SH-P2WSH-MULTISIG', 'm': m, 'n': n}
-
-    # P2WSH multi-signature
-    if re.match('^(?i)(P2WSH)-\d+-(?i)(of)-\d+-(?i)(Multisig)$', txout_type):
-        m, n = int(txout_type.split('-')[1]), int(txout_type.split('-')[3])
-        multisig_check(m, n, 16)
-        return {'txout_type': 'P2WSH-MULTISIG', 'm': m, 'n': n}
-
-    # NULLDATA
-    if re.match('^(?i)(NULLDATA)-\d+$', txout_type):
-        payload = int(txout_type.split('-')[1])
+class ReadOnlyDict(dict):
+    # dict whose contents cannot be changed after construction; used for
+    # values that are cached and shared by all callers
+    __slots__ = ()
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError(f'{type(self).__name__} is read-only; use dict() for a mutable copy')
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    update = pop = popitem = setdefault = clear = _readonly
+
+    def __reduce__(self):
+        return type(self), (dict(self),)
+
+class Estimate(collections.abc.Mapping):
+    # Immutable size and weight estimate. vsize is derived from the weight on
+    # access. Not applicable estimates (e.g., the witness of a P2PKH input)
+    # have size and weight None. As a mapping, an estimate reads like the
+    # {'size': ..., 'vsize': ..., 'weight': ...} dicts used throughout the
+    # library, with 'N/A' values if not applicable.
+    __slots__ = ('size', 'weight')
+
+    def __init__(self, size, weight):
+        object.__setattr__(self, 'size', size)
+        object.__setattr__(self, 'weight', weight)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('estimates are immutable')
+
+    def __reduce__(self):
+        return Estimate, (self.size, self.weight)
+
+    @property
+    def applicable(self):
+        return self.size is not None
+
+    @property
+    def vsize(self):
+        if self.weight is None:
+            return None
+        return self.weight // 4 if self.weight % 4 == 0 else self.weight / 4
+
+    def __getitem__(self, key):
+        if key not in ('size', 'vsize', 'weight'):
+            raise KeyError(key)
+        value = getattr(self, key)
+        return value if value is not None else 'N/A'
+
+    def __iter__(self):
+        return iter(('size', 'vsize', 'weight'))
+
+    def __len__(self):
+        return 3
+
+    def __hash__(self):
+        return hash((self.size, self.weight))
+
+    def __repr__(self):
+        return f'Estimate(size={self.size}, weight={self.weight})'
+
+Estimate.NA = Estimate(None, None)
+
+def legacy_estimate(size):
+    # non-witness data counts four weight units per byte
+    return Estimate(size, 4 * size)
+
+def witness_estimate(size):
+    return Estimate(size, size)
+
+# Maximum number of distinct (normalized) txout type strings whose parsed
+# specs and estimates are kept around
+PARSE_CACHE_SIZE = 1024
+
+# (compiled pattern, txout type, maximum m/n) for m-of-n multi-signature types
+MULTISIG_PATTERNS = (
+    (re.compile(r'^(\d+)-OF-(\d+)-MULTISIG$'), 'MULTISIG', 3),
+    (re.compile(r'^P2SH-(\d+)-OF-(\d+)-MULTISIG$'), 'P2SH-MULTISIG', 16),
+    (re.compile(r'^P2SH-P2WSH-(\d+)-OF-(\d+)-MULTISIG$'), 'P2SH-P2WSH-MULTISIG', 16),
+    (re.compile(r'^P2WSH-(\d+)-OF-(\d+)-MULTISIG$'), 'P2WSH-MULTISIG', 16),
+)
+NULLDATA_PATTERN = re.compile(r'^NULLDATA-(\d+)$')
+P2TR_PATTERN = re.compile(r'^P2TR-(KEY|SCRIPT)PATH$')
+# P2TR-SCRIPTPATH-<leaf script size>-<Merkle depth>[-<stack item size>...]
+TAPSCRIPT_PATTERN = re.compile(r'^P2TR-SCRIPTPATH-(\d+)-(\d+)((?:-\d+)*)$')
+
+class TxoutSpec(ReadOnlyDict):
+    # Canonical, interned result of parse(). Behaves like the dict parse()
+    # used to return, except that it is read-only since it is shared by all
+    # callers (use dict(spec) for a mutable copy), and additionally holds the
+    # type's ID in the type table (None for types not in the table) and
+    # caches its input, output, and witness estimates.
+    __slots__ = ('name', 'id', 'estimates')
+
+    def __init__(self, name, **data):
+        super().__init__(**data)
+        self.name = name
+        self.id = None
+        self.estimates = {}
+
+    def __reduce__(self):
+        # re-interned on unpickling
+        return parse, (self.name,)
+
+_estimate_stats = {'hits': 0, 'misses': 0}
+
+def normalize(txout_type):
+    return txout_type.strip().upper()
+
+def _parse_spec(txout_type):
+    for pattern, multisig_type, max_keys in MULTISIG_PATTERNS:
+        match = pattern.match(txout_type)
+        if match:
+            m, n = int(match.group(1)), int(match.group(2))
+            multisig_check(m, n, max_keys)
+            return TxoutSpec(txout_type, txout_type=multisig_type, m=m, n=n)
+
+    match = NULLDATA_PATTERN.match(txout_type)
+    if match:
+        payload = int(match.group(1))
         if not 0 <= payload <= 80:
             raise ValueError('payload = {payload} (requirement: 1 <= payload <= 80)')
-        return {'txout_type': 'NULLDATA', 'payload': payload}
+        return TxoutSpec(txout_type, txout_type='NULLDATA', payload=payload)
+
+    match = P2TR_PATTERN.match(txout_type)
+    if match:
+        return TxoutSpec(txout_type, txout_type='P2TR', path=match.group(1).lower())
 
-    # P2TR
-    if re.match('^(?i)(P2TR)-(?i)(keypath|scriptpath)+$', txout_type):
-        path = txout_type.split('-')[1].lower()[:-4]
-        return {'txout_type': 'P2TR', 'path': path}
+    match = TAPSCRIPT_PATTERN.match(txout_type)
+    if match:
+        depth = int(match.group(2))
+        if not 0 <= depth <= TAPROOT_MAX_DEPTH:
+            raise ValueError(f'depth = {depth} (requirement: 0 <= depth <= {TAPROOT_MAX_DEPTH})')
+        stack = tuple(int(item) for item in match.group(3).split('-')[1:])
+        return TxoutSpec(txout_type, txout_type='P2TR', path='script',
+                         script=int(match.group(1)), depth=depth, stack=stack)
 
     # Remaining txout_types, no m and n
-    return {'txout_type': txout_type}
+    return TxoutSpec(txout_type, txout_type=txout_type)
 
-def input_est(txout_type):
-    data = parse(txout_type)
-    try:
-        script_size = script_sig(data)
-        input_size = varint(script_size) + script_size + INPUT_OVERHEAD
-        return {'size': input_size, 'vsize': input_size, 'weight': input_size*4}
-    except ValueError:
-        return {'size': 'N/A', 'vsize': 'N/A', 'weight': 'N/A'}
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse(txout_type):
+    spec = _parse_spec(txout_type)
+    spec.id = type_ids().get(txout_type)
+    return spec
 
-def output_est(txout_type):
-    data = parse(txout_type)
+def parse(txout_type):
+    return _parse(normalize(txout_type))
+
+def cache_info():
+    return {'parse': _parse.cache_info(), 'estimates': dict(_estimate_stats)}
+
+def cache_clear():
+    _parse.cache_clear()
+    _estimate_stats['hits'] = _estimate_stats['misses'] = 0
+
+# Parts of a type in the type table
+INPUT, WITNESS, OUTPUT = 0, 1, 2
+NUM_PARTS = 3
+# Sentinels in the type table: the part does not exist for the type (e.g., the
+# witness of a P2PKH input), or it cannot be sized (e.g., the witness of a P2TR
+# output whose spending path is unknown)
+NOT_APPLICABLE = -1
+UNSUPPORTED = -2
+
+# Built on first use and published in a single assignment, so that threads
+# running estimates concurrently never see a partially built table
+_type_table = None
+
+def supported_types():
+    # normalized names of all types accepted by parse(), except for
+    # alternative spellings such as leading zeros in m, n, or payload
+    yield from ('P2PK', 'P2PKH', 'P2SH', 'P2SH-P2WPKH', 'P2WPKH', 'P2WSH',
+                'P2TR', 'P2TR-KEYPATH', 'P2TR-SCRIPTPATH')
+    for prefix, max_keys in (('', 3), ('P2SH-', 16), ('P2SH-P2WSH-', 16), ('P2WSH-', 16)):
+        for m in range(1, max_keys + 1):
+            for n in range(1, max_keys + 1):
+                yield f'{prefix}{m}-OF-{n}-MULTISIG'
+    for payload in range(0, 80 + 1):
+        yield f'NULLDATA-{payload}'
+
+def part_size(data, part):
+    # size of an input, witness, or output from the formula functions
     try:
+        if part == INPUT:
+            script_size = script_sig(data)
+            return varint(script_size) + script_size + INPUT_OVERHEAD
+        if part == WITNESS:
+            return witness(data)
         script_size = script_pubkey(data)
-        output_size = varint(script_size) + script_size + OUTPUT_OVERHEAD
-        return {'size': output_size, 'vsize': output_size, 'weight': output_size*4}
+        return varint(script_size) + script_size + OUTPUT_OVERHEAD
     except ValueError:
-        return {'size': 'N/A', 'vsize': 'N/A', 'weight': 'N/A'}
+        return NOT_APPLICABLE
 
-def witness_est(txout_type):
-    data = parse(txout_type)
+def build_type_table():
+    # names in ID order and a flat array of NUM_PARTS sizes per ID
+    names = tuple(supported_types())
+    sizes = array.array('i')
+    for name in names:
+        data = _parse_spec(name)
+        for part in (INPUT, WITNESS, OUTPUT):
+            try:
+                sizes.append(part_size(data, part))
+            except (NotImplementedError, KeyError):
+                sizes.append(UNSUPPORTED)
+    return names, sizes
+
+def _load_type_table():
+    global _type_table
+    table = _type_table
+    if table is None:
+        names, sizes = build_type_table()
+        table = {'names': names,
+                 'ids': {name: num for num, name in enumerate(names)},
+                 'sizes': memoryview(sizes).toreadonly()}
+        _type_table = table
+    return table
+
+def type_ids():
+    return _load_type_table()['ids']
+
+def type_table():
+    # type names in ID order and a read-only view of the sizes, with the size
+    # of part p of type ID i at index i*NUM_PARTS + p
+    table = _load_type_table()
+    return table['names'], table['sizes']
+
+def type_id(txout_type):
+    return parse(txout_type).id
+
+def check_type_table():
+    # regenerates the table and diffs it against the formula functions;
+    # returns a list of (type, part, table size, formula size) mismatches
+    names, sizes = type_table()
+    fresh_names, fresh_sizes = build_type_table()
+    if names != fresh_names:
+        raise AssertionError('type table names differ from supported types')
+    mismatches = []
+    for num, name in enumerate(names):
+        data = _parse_spec(name)
+        for part in (INPUT, WITNESS, OUTPUT):
+            try:
+                size = part_size(data, part)
+            except (NotImplementedError, KeyError):
+                size = UNSUPPORTED
+            for table_size in (sizes[num*NUM_PARTS + part], fresh_sizes[num*NUM_PARTS + part]):
+                if table_size != size:
+                    mismatches.append((name, part, table_size, size))
+    return mismatches
+
+def spec_size(spec, part):
+    if spec.id is not None:
+        size = _load_type_table()['sizes'][spec.id*NUM_PARTS + part]
+        if size != UNSUPPORTED:
+            return size
+    # not in the table, or raises the formula's error
+    return part_size(spec, part)
+
+def cached_estimate(txout_type, part, estimator):
+    spec = parse(txout_type)
     try:
-        witness_size = witness(data)
-        return {'size': witness_size, 'vsize': witness_size/4, 'weight': witness_size}
-    except ValueError:
-        return {'size': 'N/A', 'vsize': 'N/A', 'weight': 'N/A'}
+        estimate = spec.estimates[part]
+        _estimate_stats['hits'] += 1
+    except KeyError:
+        estimate = spec.estimates[part] = estimator(spec)
+        _estimate_stats['misses'] += 1
+    return estimate
+
+def _input_est(data):
+    input_size = spec_size(data, INPUT)
+    if input_size == NOT_APPLICABLE:
+        return Estimate.NA
+    return legacy_estimate(input_size)
+
+def _output_est(data):
+    output_size = spec_size(data, OUTPUT)
+    if output_size == NOT_APPLICABLE:
+        return Estimate.NA
+    return legacy_estimate(output_size)
+
+def _witness_est(data):
+    witness_size = spec_size(data, WITNESS)
+    if witness_size == NOT_APPLICABLE:
+        return Estimate.NA
+    return witness_estimate(witness_size)
+
+def input_est(txout_type):
+    return cached_estimate(txout_type, 'input', _input_est)
+
+def output_est(txout_type):
+    return cached_estimate(txout_type, 'output', _output_est)
+
+def witness_est(txout_type):
+    return cached_estimate(txout_type, 'witness', _witness_est)
 
 def tx_est(inputs, outputs):
-    input_bytes = sum([input_est(i)['size'] for i in inputs])
-    witness_bytes = sum([(witness_est(i)['size'] if witness_est(i)['size'] != 'N/A' else 0) for i in inputs])
-    output_bytes = sum([output_est(o)['size'] for o in outputs])
+    return tx_est_counts(collections.Counter(inputs), collections.Counter(outputs))
+
+def check_count(count, txout_type):
+    if not isinstance(count, numbers.Integral):
+        raise TypeError(f'count {count!r} for {txout_type} is not an integer')
+    if count < 0:
+        raise ValueError(f'negative count {count} for {txout_type}')
+
+def tx_est_counts(inputs, outputs):
+    # inputs and outputs map txout types to their number of occurrences (e.g.
+    # a collections.Counter), so the cost only depends on the number of
+    # distinct types
+    num_inputs = num_outputs = 0
+    input_bytes = witness_bytes = output_bytes = 0
+    no_witness_inputs = 0
+    for txout_type, count in inputs.items():
+        check_count(count, txout_type)
+        if not count:
+            continue
+        num_inputs += count
+        input_bytes += count * input_est(txout_type).size
+        witness_size = witness_est(txout_type).size
+        if witness_size is not None:
+            witness_bytes += count * witness_size
+        else:
+            no_witness_inputs += count
+    for txout_type, count in outputs.items():
+        check_count(count, txout_type)
+        if not count:
+            continue
+        num_outputs += count
+        output_bytes += count * output_est(txout_type).size
+    return tx_totals(num_inputs, num_outputs, input_bytes, witness_bytes,
+                     no_witness_inputs, output_bytes)
+
+def tx_totals(num_inputs, num_outputs, input_bytes, witness_bytes, no_witness_inputs, output_bytes):
+    # tx_est result from the number of inputs and outputs, the summed sizes of
+    # inputs, witnesses, and outputs, and the number of inputs without witness
+
     # add extra byte(s) to signal lack of witness data for inputs using no
     # witnesses in case of segwit transactions
     if witness_bytes > 0:
-        witness_bytes += sum([1 if witness_est(i)['size'] == 'N/A' else 0 for i in inputs])
-
+        witness_bytes += no_witness_inputs
 
     legacy_size = TX_OVERHEAD
-    legacy_size += varint(len(inputs)) + input_bytes
-    legacy_size += varint(len(outputs)) + output_bytes
+    legacy_size += varint(num_inputs) + input_bytes
+    legacy_size += varint(num_outputs) + output_bytes
     witness_size = (witness_bytes + SEGWIT_OVERHEAD) if witness_bytes > 0 else 0
 
     size = legacy_size + witness_size
     weight = 4 * legacy_size + witness_size
-    vsize = weight / 4
 
-    overhead_bytes = TX_OVERHEAD + varint(len(inputs)) + varint(len(outputs)) + (SEGWIT_OVERHEAD if witness_bytes > 0 else 0)
+    overhead_bytes = TX_OVERHEAD + varint(num_inputs) + varint(num_outputs) + (SEGWIT_OVERHEAD if witness_bytes > 0 else 0)
     overhead_weight = 4*TX_OVERHEAD + (SEGWIT_OVERHEAD if witness_bytes > 0 else 0)
 
-    return {'total': {'size': size, 'weight': weight, 'vsize': vsize},
-            'inputs': {'size': input_bytes, 'weight': input_bytes*4, 'vsize': input_bytes},
-            'witnesses': {'size': witness_bytes, 'weight': witness_bytes, 'vsize': witness_bytes/4},
-            'outputs': {'size': output_bytes, 'weight': output_bytes*4, 'vsize': output_bytes/4},
-            'overhead': {'size': overhead_bytes, 'weight': overhead_weight, 'vsize': overhead_weight/4}
+    return {'total': Estimate(size, weight),
+            'inputs': legacy_estimate(input_bytes),
+            'witnesses': witness_estimate(witness_bytes),
+            'outputs': legacy_estimate(output_bytes),
+            'overhead': Estimate(overhead_bytes, overhead_weight)
             }
+
+class TxSizeAccumulator:
+    # Running transaction estimate for coin selection and fee bumping: inputs
+    # and outputs are added and removed in O(1), and estimate() agrees with
+    # tx_est for the current inputs and outputs.
+    __slots__ = ('num_inputs', 'num_outputs', 'input_bytes', 'witness_bytes',
+                 'output_bytes', 'no_witness_inputs', 'inputs', 'outputs')
+
+    def __init__(self, inputs=(), outputs=()):
+        self.num_inputs = self.num_outputs = 0
+        self.input_bytes = self.witness_bytes = self.output_bytes = 0
+        self.no_witness_inputs = 0
+        self.inputs = collections.Counter()
+        self.outputs = collections.Counter()
+        for txout_type in inputs:
+            self.add_input(txout_type)
+        for txout_type in outputs:
+            self.add_output(txout_type)
+
+    def add_input(self, txout_type, count=1):
+        self._check_count(count)
+        self._add_input(txout_type, count)
+
+    def remove_input(self, txout_type, count=1):
+        self._check_count(count)
+        if self.inputs[txout_type] < count:
+            raise ValueError(f'cannot remove {count} {txout_type} input(s), '
+                             f'only {self.inputs[txout_type]} present')
+        self._add_input(txout_type, -count)
+        if not self.inputs[txout_type]:
+            del self.inputs[txout_type]
+
+    def add_output(self, txout_type, count=1):
+        self._check_count(count)
+        self._add_output(txout_type, count)
+
+    def remove_output(self, txout_type, count=1):
+        self._check_count(count)
+        if self.outputs[txout_type] < count:
+            raise ValueError(f'cannot remove {count} {txout_type} output(s), '
+                             f'only {self.outputs[txout_type]} present')
+        self._add_output(txout_type, -count)
+        if not self.outputs[txout_type]:
+            del self.outputs[txout_type]
+
+    @staticmethod
+    def _check_count(count):
+        if not isinstance(count, numbers.Integral):
+            raise TypeError(f'count {count!r} is not an integer')
+        if count < 1:
+            raise ValueError(f'count must be at least 1, got {count}')
+
+    def _add_input(self, txout_type, count):
+        # count is negative when removing inputs
+        input_size = input_est(txout_type).size
+        if input_size is None:
+            raise ValueError(f'txout type {txout_type} cannot be spent')
+        witness_size = witness_est(txout_type).size
+        self.inputs[txout_type] += count
+        self.num_inputs += count
+        self.input_bytes += count * input_size
+        if witness_size is not None:
+            self.witness_bytes += count * witness_size
+        else:
+            self.no_witness_inputs += count
+
+    def _add_output(self, txout_type, count):
+        # count is negative when removing outputs
+        output_size = output_est(txout_type).size
+        self.outputs[txout_type] += count
+        self.num_outputs += count
+        self.output_bytes += count * output_size
+
+    def snapshot(self):
+        return (self.num_inputs, self.num_outputs, self.input_bytes,
+                self.witness_bytes, self.output_bytes, self.no_witness_inputs,
+                self.inputs.copy(), self.outputs.copy())
+
+    def rollback(self, snapshot):
+        (self.num_inputs, self.num_outputs, self.input_bytes,
+         self.witness_bytes, self.output_bytes, self.no_witness_inputs,
+         inputs, outputs) = snapshot
+        # copy again so the same snapshot can be rolled back to repeatedly
+        self.inputs, self.outputs = inputs.copy(), outputs.copy()
+
+    @property
+    def segwit(self):
+        return self.witness_bytes > 0
+
+    @property
+    def legacy_size(self):
+        return (TX_OVERHEAD + varint(self.num_inputs) + self.input_bytes
+                + varint(self.num_outputs) + self.output_bytes)
+
+    @property
+    def witness_size(self):
+        if not self.segwit:
+            return 0
+        return self.witness_bytes + self.no_witness_inputs + SEGWIT_OVERHEAD
+
+    @property
+    def size(self):
+        return self.legacy_size + self.witness_size
+
+    @property
+    def weight(self):
+        return 4 * self.legacy_size + self.witness_size
+
+    @property
+    def vsize(self):
+        return self.weight / 4
+
+    def estimate(self):
+        return tx_totals(self.num_inputs, self.num_outputs, self.input_bytes,
+                         self.witness_bytes, self.no_witness_inputs, self.output_bytes)
+
+def size_table(input_types, output_types):
+    # per-type sizes for tx_est_batch: input size, witness size (zero for
+    # inputs without witness), a witness flag per input type, and output size
+    input_sizes, witness_sizes, has_witness = [], [], []
+    for txout_type in input_types:
+        input_size = input_est(txout_type).size
+        if input_size is None:
+            raise ValueError(f'txout type {txout_type} cannot be spent')
+        witness_size = witness_est(txout_type).size
+        input_sizes.append(input_size)
+        witness_sizes.append(witness_size if witness_size is not None else 0)
+        has_witness.append(1 if witness_size is not None else 0)
+    output_sizes = [output_est(txout_type).size for txout_type in output_types]
+    return {'inputs': input_sizes, 'witnesses': witness_sizes,
+            'has_witness': has_witness, 'outputs': output_sizes}
+
+def varint_array(num):
+    return 1 + 2*(num >= 0xFD) + 2*(num > 0xFFFF) + 4*(num > 0xFFFFFFFF)
+
+def tx_est_batch(input_types, input_counts, output_types, output_counts):
+    # input_counts and output_counts are 2-D matrices with one row per
+    # transaction and one column per entry of input_types and output_types,
+    # respectively; returns the total size, weight, and vsize per transaction
+    # (columns of repeated types are summed)
+    input_types, output_types = list(input_types), list(output_types)
+    if not input_types or not output_types:
+        raise ValueError('tx_est_batch requires at least one input type and one output type')
+    table = size_table(input_types, output_types)
+    if numpy is None:
+        return _tx_est_batch_python(input_types, input_counts, output_types, output_counts)
+
+    input_counts = _count_matrix(input_counts, input_types, 'input')
+    output_counts = _count_matrix(output_counts, output_types, 'output')
+    if input_counts.shape[0] != output_counts.shape[0]:
+        raise ValueError(f'{input_counts.shape[0]} input rows but '
+                         f'{output_counts.shape[0]} output rows')
+
+    num_inputs = input_counts.sum(axis=1)
+    num_outputs = output_counts.sum(axis=1)
+    input_bytes = input_counts @ numpy.array(table['inputs'], dtype=numpy.int64)
+    output_bytes = output_counts @ numpy.array(table['outputs'], dtype=numpy.int64)
+    witness_bytes = input_counts @ numpy.array(table['witnesses'], dtype=numpy.int64)
+    no_witness_inputs = num_inputs - input_counts @ numpy.array(table['has_witness'], dtype=numpy.int64)
+    # segwit transactions: extra byte(s) to signal lack of witness data for
+    # inputs using no witnesses, plus marker and flag
+    segwit = witness_bytes > 0
+    witness_size = numpy.where(segwit, witness_bytes + no_witness_inputs + SEGWIT_OVERHEAD, 0)
+
+    legacy_size = TX_OVERHEAD
+    legacy_size += varint_array(num_inputs) + input_bytes
+    legacy_size += varint_array(num_outputs) + output_bytes
+
+    size = legacy_size + witness_size
+    weight = 4 * legacy_size + witness_size
+    return {'size': size, 'weight': weight, 'vsize': weight / 4}
+
+def _count_matrix(counts, types, side):
+    counts = numpy.asarray(counts)
+    if counts.size == 0:
+        counts = counts.astype(numpy.int64).reshape(0, len(types))
+    elif not numpy.issubdtype(counts.dtype, numpy.integer):
+        raise TypeError(f'{side} counts must be integers, got {counts.dtype}')
+    counts = counts.astype(numpy.int64, copy=False)
+    if counts.ndim != 2 or counts.shape[1] != len(types):
+        raise ValueError(f'{side} counts must have one column per {side} type '
+                         f'({len(types)}), got shape {counts.shape}')
+    if (counts < 0).any():
+        raise ValueError('negative counts')
+    return counts
+
+def _count_row(row, types, side, num):
+    counts = collections.Counter()
+    row = list(row)
+    if len(row) != len(types):
+        raise ValueError(f'row {num}: {len(row)} {side} counts for {len(types)} {side} types')
+    for txout_type, count in zip(types, row):
+        # bools are rejected like NumPy's bool dtype
+        if not isinstance(count, numbers.Integral) or isinstance(count, bool):
+            raise TypeError(f'{side} counts must be integers, got {type(count).__name__}')
+        if count < 0:
+            raise ValueError('negative counts')
+        counts[txout_type] += count
+    return counts
+
+def _tx_est_batch_python(input_types, input_counts, output_types, output_counts):
+    input_counts, output_counts = list(input_counts), list(output_counts)
+    if len(input_counts) != len(output_counts):
+        raise ValueError(f'{len(input_counts)} input rows but '
+                         f'{len(output_counts)} output rows')
+    res = {'size': [], 'weight': [], 'vsize': []}
+    for num, (input_row, output_row) in enumerate(zip(input_counts, output_counts)):
+        total = tx_est_counts(_count_row(input_row, input_types, 'input', num),
+                              _count_row(output_row, output_types, 'output', num))['total']
+        for metric in res:
+            res[metric].append(total[metric])
+    return res
+
+def read_varint(view, pos):
+    # returns value and position after a compact size encoded integer
+    if pos >= len(view):
+        raise ValueError(f'truncated transaction: varint at {pos}')
+    first = view[pos]
+    if first < 0xFD:
+        return first, pos + 1
+    width = {0xFD: 2, 0xFE: 4, 0xFF: 8}[first]
+    if pos + 1 + width > len(view):
+        raise ValueError(f'truncated transaction: varint at {pos}')
+    return int.from_bytes(view[pos+1:pos+1+width], 'little'), pos + 1 + width
+
+def read_bytes(view, pos, num_bytes):
+    # returns a zero-copy slice and the position after it
+    if pos + num_bytes > len(view):
+        raise ValueError(f'truncated transaction: {num_bytes} bytes at {pos}')
+    return view[pos:pos+num_bytes], pos + num_bytes
+
+def classify(script):
+    # maps a scriptPubKey to the txout type vocabulary used by parse()
+    size = len(script)
+    if size == 25 and script[0] == 0x76 and script[1] == 0xA9 and script[2] == 0x14 \
+            and script[23] == 0x88 and script[24] == 0xAC:
+        return 'P2PKH'
+    if size == 23 and script[0] == 0xA9 and script[1] == 0x14 and script[22] == 0x87:
+        return 'P2SH'
+    if size == 22 and script[0] == 0x00 and script[1] == 0x14:
+        return 'P2WPKH'
+    if size == 34 and script[0] == 0x00 and script[1] == 0x20:
+        return 'P2WSH'
+    if size == 34 and script[0] == 0x51 and script[1] == 0x20:
+        return 'P2TR'
+    if (size == 35 and script[0] == 0x21 or size == 67 and script[0] == 0x41) \
+            and script[-1] == 0xAC:
+        return 'P2PK'
+    if size >= 1 and script[0] == 0x6A:
+        # OP_RETURN followed by a single push
+        if size == 1:
+            return 'NULLDATA-0'
+        if script[1] <= 0x4B and size == 2 + script[1]:
+            return f'NULLDATA-{script[1]}'
+        if script[1] == 0x4C and size >= 3 and size == 3 + script[2]:
+            return f'NULLDATA-{script[2]}'
+    if size >= 3 and script[-1] == 0xAE and 0x51 <= script[0] <= 0x60 \
+            and 0x51 <= script[-2] <= 0x60:
+        # OP_m <len> <ECDSA pubkey 1> ... <len> <ECDSA pubkey n> OP_n OP_CHECKMULTISIG
+        m, n = script[0] - 0x50, script[-2] - 0x50
+        if size == 3 + n * (1 + ECDSA_PUBKEY) and m <= n:
+            return f'{m}-of-{n}-MULTISIG'
+    return 'NONSTANDARD'
+
+def pushes(script):
+    # data pushed by a push-only script, or None if script is not push-only
+    items = []
+    pos = 0
+    while pos < len(script):
+        opcode = script[pos]
+        if opcode == 0x00:
+            items.append(script[pos:pos])
+            pos += 1
+            continue
+        if opcode <= 0x4B:
+            num_bytes, pos = opcode, pos + 1
+        elif opcode in (0x4C, 0x4D, 0x4E):
+            width = {0x4C: 1, 0x4D: 2, 0x4E: 4}[opcode]
+            num_bytes = int.from_bytes(script[pos+1:pos+1+width], 'little')
+            pos += 1 + width
+        else:
+            return None
+        if pos + num_bytes > len(script):
+            return None
+        items.append(script[pos:pos+num_bytes])
+        pos += num_bytes
+    return items
+
+def classify_input(script_sig, stack):
+    # maps the scriptSig and witness stack of an input to the txout type
+    # vocabulary used by parse(); types that cannot be told from the input
+    # alone (e.g., bare multisig, whose n is not part of the input) are
+    # NONSTANDARD
+    items = pushes(script_sig)
+    if items is None:
+        return 'NONSTANDARD'
+
+    if not stack:
+        if len(items) == 1 and len(items[0]) and items[0][0] == 0x30:
+            return 'P2PK'
+        if len(items) == 2 and len(items[1]) in (33, 65):
+            return 'P2PKH'
+        if len(items) >= 3 and not len(items[0]):
+            # OP_0 <sig 1> ... <sig m> <redeem script>
+            redeem_type = classify(items[-1])
+            if redeem_type.endswith('-MULTISIG'):
+                return f'P2SH-{redeem_type}'
+        return 'NONSTANDARD'
+
+    if not items:
+        if len(stack) == 2 and len(stack[1]) == 33 and stack[1][0] in (0x02, 0x03):
+            return 'P2WPKH'
+        if len(stack) == 1 and len(stack[0]) in (64, 65):
+            return 'P2TR-keypath'
+        if len(stack) >= 2 and len(stack[-1]) >= 33 and (len(stack[-1]) - 33) % 32 == 0 \
+                and stack[-1][0] & 0xFE == 0xC0:
+            # <stack items> <tapscript> <control block>
+            return 'P2TR-scriptpath'
+        if len(stack) >= 3 and not len(stack[0]):
+            witness_type = classify(stack[-1])
+            if witness_type.endswith('-MULTISIG'):
+                return f'P2WSH-{witness_type}'
+        return 'NONSTANDARD'
+
+    if len(items) == 1 and len(items[0]) == 22 and items[0][0] == 0x00 and items[0][1] == 0x14:
+        return 'P2SH-P2WPKH'
+    if len(items) == 1 and len(items[0]) == 34 and items[0][0] == 0x00 and items[0][1] == 0x20 \
+            and len(stack) >= 3 and not len(stack[0]):
+        witness_type = classify(stack[-1])
+        if witness_type.endswith('-MULTISIG'):
+            return f'P2SH-P2WSH-{witness_type}'
+    return 'NONSTANDARD'
+
+def measure_at(view, pos):
+    # measures the serialized transaction starting at pos; returns the result
+    # of tx_measure and the position after the transaction
+    start = pos
+    _, pos = read_bytes(view, pos, 4)
+    segwit = pos + 1 < len(view) and view[pos] == 0x00 and view[pos+1] == 0x01
+    if segwit:
+        pos += SEGWIT_OVERHEAD
+
+    num_inputs, pos = read_varint(view, pos)
+    inputs, script_sigs = [], []
+    for _ in range(num_inputs):
+        input_start = pos
+        _, pos = read_bytes(view, pos, 32 + 4)
+        script_size, pos = read_varint(view, pos)
+        script, pos = read_bytes(view, pos, script_size)
+        _, pos = read_bytes(view, pos, 4)
+        inputs.append(pos - input_start)
+        script_sigs.append(script)
+
+    num_outputs, pos = read_varint(view, pos)
+    outputs, output_types = [], []
+    for _ in range(num_outputs):
+        output_start = pos
+        _, pos = read_bytes(view, pos, OUTPUT_OVERHEAD)
+        script_size, pos = read_varint(view, pos)
+        script, pos = read_bytes(view, pos, script_size)
+        outputs.append(pos - output_start)
+        output_types.append(classify(script))
+
+    witnesses, stacks = [], []
+    if segwit:
+        for _ in range(num_inputs):
+            witness_start = pos
+            num_items, pos = read_varint(view, pos)
+            stack = []
+            for _ in range(num_items):
+                item_size, pos = read_varint(view, pos)
+                item, pos = read_bytes(view, pos, item_size)
+                stack.append(item)
+            witnesses.append(pos - witness_start if num_items else None)
+            stacks.append(stack)
+    input_types = [classify_input(script_sig, stacks[num] if segwit else [])
+                   for num, script_sig in enumerate(script_sigs)]
+    _, pos = read_bytes(view, pos, 4)
+
+    input_bytes = sum(inputs)
+    output_bytes = sum(outputs)
+    # empty witnesses of inputs without witness data still take one byte
+    witness_bytes = sum(w if w is not None else 1 for w in witnesses)
+    size = pos - start
+    weight = 4 * (size - (witness_bytes + SEGWIT_OVERHEAD if segwit else 0)) + \
+        (witness_bytes + SEGWIT_OVERHEAD if segwit else 0)
+
+    overhead_bytes = TX_OVERHEAD + varint(num_inputs) + varint(num_outputs) + (SEGWIT_OVERHEAD if segwit else 0)
+    overhead_weight = 4*TX_OVERHEAD + (SEGWIT_OVERHEAD if segwit else 0)
+
+    return {'total': Estimate(size, weight),
+            'inputs': legacy_estimate(input_bytes),
+            'witnesses': witness_estimate(witness_bytes),
+            'outputs': legacy_estimate(output_bytes),
+            'overhead': Estimate(overhead_bytes, overhead_weight),
+            'parts': {'inputs': [legacy_estimate(i) for i in inputs],
+                      'witnesses': [witness_estimate(w) if w is not None else Estimate.NA
+                                    for w in (witnesses or [None] * num_inputs)],
+                      'outputs': [legacy_estimate(o) for o in outputs]},
+            'input_types': input_types,
+            'output_types': output_types
+            }, pos
+
+def tx_measure(raw):
+    # exact size and weight of a serialized transaction (bytes, bytearray, or
+    # memoryview), in the format of tx_est plus per-part measurements under
+    # 'parts' and the classified type of each input and output under
+    # 'input_types' and 'output_types'
+    view = raw if isinstance(raw, memoryview) else memoryview(raw)
+    res, end = measure_at(view, 0)
+    if end != len(view):
+        raise ValueError(f'{len(view) - end} trailing bytes after transaction')
+    return res
+
+MAX_STANDARD_TX_WEIGHT = 400000  # cf. Bitcoin Core's policy/policy.h
+
+def max_count(txout_type, side='output', inputs=(), outputs=(), max_weight=None,
+              max_vsize=None, max_fee=None, feerate=None):
+    # largest number of inputs or outputs (side) of txout_type that can be
+    # added to the fixed inputs and outputs while the tx_est total stays within
+    # all given budgets (fee in sat, computed as feerate [sat/vB] * vsize
+    # rounded up)
+    if side not in ('input', 'output'):
+        raise ValueError(f'unknown side: {side}')
+    budgets = []
+    if max_weight is not None:
+        budgets.append(fractions.Fraction(max_weight))
+    if max_vsize is not None:
+        budgets.append(4 * fractions.Fraction(max_vsize))
+    if max_fee is not None:
+        if not feerate:
+            raise ValueError('fee budget requires a positive feerate')
+        # ceil(feerate * weight / 4) <= max_fee iff feerate * weight / 4 <= floor(max_fee)
+        budgets.append(4 * fractions.Fraction(math.floor(max_fee)) / fractions.Fraction(feerate))
+    if not budgets:
+        raise ValueError('no budget given')
+    budget = math.floor(min(budgets))
+
+    fixed_inputs = collections.Counter(inputs)
+    fixed_outputs = collections.Counter(outputs)
+    fixed = sum((fixed_inputs if side == 'input' else fixed_outputs).values())
+
+    def weight(count):
+        variable = collections.Counter({txout_type: count})
+        if side == 'input':
+            return tx_est_counts(fixed_inputs + variable, fixed_outputs)['total']['weight']
+        return tx_est_counts(fixed_inputs, fixed_outputs + variable)['total']['weight']
+
+    if weight(0) > budget:
+        raise ValueError(f'fixed parts exceed budget of {budget} WU')
+    # the weight is affine in count between the points where the segwit
+    # marker and flag appear (count 1) and where the varint count prefix grows
+    starts = [1] + [bound - fixed for bound in (0xFD, 0xFFFF + 1, 0xFFFFFFFF + 1) if bound - fixed > 1]
+    starts.append(0xFFFFFFFFFFFFFFFF + 1 - fixed)
+    best = 0
+    for lo, next_lo in zip(starts, starts[1:]):
+        start_weight = weight(lo)
+        if start_weight > budget:
+            break
+        hi = next_lo - 1
+        step = weight(lo + 1) - start_weight if hi > lo else 0
+        best = hi if step == 0 else min(hi, lo + (budget - start_weight) // step)
+        if best < hi:
+            break
+    return best
+
+# Signature length distributions (including the sighash byte). DER-encoded
+# ECDSA signatures with low-S have a 32-byte S; R takes 33 bytes if its top bit
+# is set, which wallets grinding for low-R avoid. Either shrinks by one byte
+# if its leading byte happens to be zero (about 1/256). Schnorr signatures are
+# 64 bytes with SIGHASH_DEFAULT and 65 bytes otherwise.
+SIGNING_PROFILES = {
+    'default': {'ECDSA_SIG': {71: 1.0}, 'SCHNORR_SIG': {64: 1.0}},
+    'low-r': {'ECDSA_SIG': {70: 1/128, 71: 127/128}, 'SCHNORR_SIG': {64: 1.0}},
+    'random-r': {'ECDSA_SIG': {70: 3/512, 71: 253/512, 72: 256/512}, 'SCHNORR_SIG': {64: 1.0}},
+    'high-s': {'ECDSA_SIG': {71: 1/4, 72: 1/2, 73: 1/4}, 'SCHNORR_SIG': {64: 1.0}},
+    'sighash-all': {'ECDSA_SIG': {70: 1/128, 71: 127/128}, 'SCHNORR_SIG': {65: 1.0}},
+}
+PMF_EPSILON = 1e-15             # tail probability mass dropped after convolutions
+FFT_THRESHOLD = 64              # convolve longer PMFs via FFT (NumPy only)
+
+# input types whose signatures are in the scriptSig rather than the witness
+SCRIPT_SIG_SIGNATURES = ('P2PK', 'P2PKH', 'MULTISIG', 'P2SH-MULTISIG')
+
+def signing_profile(profile):
+    if isinstance(profile, str):
+        if profile not in SIGNING_PROFILES:
+            raise ValueError(f'unknown signing profile: {profile}')
+        profile = SIGNING_PROFILES[profile]
+    return profile
+
+def set_signing_profile(profile):
+    # use the most likely signature lengths of profile for point estimates
+    global ECDSA_SIG, SCHNORR_SIG, _type_table
+    profile = signing_profile(profile)
+    ECDSA_SIG = max(profile['ECDSA_SIG'], key=profile['ECDSA_SIG'].get)
+    SCHNORR_SIG = max(profile['SCHNORR_SIG'], key=profile['SCHNORR_SIG'].get)
+    # cached estimates and the type table depend on the signature lengths
+    cache_clear()
+    _type_table = None
+
+def signatures(data):
+    # number of ECDSA and Schnorr signatures needed to spend txout type
+    if data['txout_type'] in ('P2PK', 'P2PKH', 'P2WPKH', 'P2SH-P2WPKH'):
+        return 1, 0
+    if data['txout_type'].endswith('MULTISIG'):
+        return data['m'], 0
+    if data['txout_type'] == 'P2TR' and data.get('path') == 'key':
+        return 0, 1
+    return 0, 0
+
+# PMFs are (offset, probs) pairs, with probs[i] the probability of offset + i
+
+def pmf(values):
+    offset = min(values)
+    probs = [0.0] * (max(values) - offset + 1)
+    for value, prob in values.items():
+        probs[value - offset] += prob
+    return offset, probs
+
+def trim(dist):
+    offset, probs = dist
+    lo, hi = 0, len(probs)
+    mass = 0.0
+    while lo < hi - 1 and mass + probs[lo] < PMF_EPSILON:
+        mass += probs[lo]
+        lo += 1
+    mass = 0.0
+    while hi - 1 > lo and mass + probs[hi-1] < PMF_EPSILON:
+        mass += probs[hi-1]
+        hi -= 1
+    return offset + lo, probs[lo:hi]
+
+def convolve(a, b):
+    (a_offset, a_probs), (b_offset, b_probs) = a, b
+    if numpy is not None:
+        if min(len(a_probs), len(b_probs)) > FFT_THRESHOLD:
+            num = len(a_probs) + len(b_probs) - 1
+            probs = numpy.fft.irfft(numpy.fft.rfft(a_probs, num) * numpy.fft.rfft(b_probs, num), num)
+            probs = numpy.clip(probs, 0.0, None)
+        else:
+            probs = numpy.convolve(a_probs, b_probs)
+        probs = probs.tolist()
+    else:
+        probs = [0.0] * (len(a_probs) + len(b_probs) - 1)
+        for i, a_prob in enumerate(a_probs):
+            if a_prob:
+                for j, b_prob in enumerate(b_probs):
+                    probs[i + j] += a_prob * b_prob
+    return trim((a_offset + b_offset, probs))
+
+def power(dist, count):
+    # distribution of the sum of count independent draws, by squaring
+    res = (0, [1.0])
+    while count:
+        if count & 1:
+            res = convolve(res, dist)
+        count >>= 1
+        if count:
+            dist = convolve(dist, dist)
+    return res
+
+def part_dist(data, profile, points):
+    # distributions of the (size, weight) difference of one input of txout
+    # type data to its point estimate, which uses the signature lengths in
+    # points (keyed like profile)
+    num_ecdsa, num_schnorr = signatures(data)
+    deltas = (0, [1.0])
+    for kind, num in (('ECDSA_SIG', num_ecdsa), ('SCHNORR_SIG', num_schnorr)):
+        if num:
+            sig = pmf({length - points[kind]: prob for length, prob in profile[kind].items()})
+            deltas = convolve(deltas, power(sig, num))
+
+    in_script_sig = data['txout_type'] in SCRIPT_SIG_SIGNATURES
+    if in_script_sig:
+        script_size = script_sig(data)
+        base = varint(script_size) + script_size
+    size_deltas, weight_deltas = {}, {}
+    offset, probs = deltas
+    for i, prob in enumerate(probs):
+        delta = offset + i
+        if in_script_sig:
+            # the scriptSig's length prefix may grow or shrink
+            size_delta = varint(script_size + delta) + script_size + delta - base
+        else:
+            size_delta = delta
+        weight_delta = 4 * size_delta if in_script_sig else size_delta
+        size_deltas[size_delta] = size_deltas.get(size_delta, 0.0) + prob
+        weight_deltas[weight_delta] = weight_deltas.get(weight_delta, 0.0) + prob
+    return pmf(size_deltas), pmf(weight_deltas)
+
+def summarize(base, dist, percentiles, scale=1):
+    offset, probs = dist
+    total = sum(probs)
+    res = {'pmf': {}, 'mean': 0.0}
+    cdf = 0.0
+    targets = sorted(percentiles)
+    for i, prob in enumerate(probs):
+        value = (base + offset + i) / scale if scale != 1 else base + offset + i
+        if prob:
+            res['pmf'][value] = prob / total
+            res['mean'] += value * prob / total
+        cdf += prob / total
+        while targets and cdf >= targets[0] / 100 - 1e-12:
+            res[f'p{targets.pop(0)}'] = value
+    for p in targets:
+        res[f'p{p}'] = (base + offset + len(probs) - 1) / scale if scale != 1 else base + offset + len(probs) - 1
+    return res
+
+def tx_est_dist(inputs, outputs, profile='low-r', percentiles=(50, 90, 99)):
+    # size, weight, and vsize distributions of a transaction given the
+    # signature length distributions of a signing profile. Each metric maps
+    # to its probability mass function ('pmf'), 'mean', the requested
+    # percentiles (e.g., 'p99'), and the exact 'min' and 'max'.
+    profile = signing_profile(profile)
+    inputs, outputs = collections.Counter(inputs), collections.Counter(outputs)
+    total = tx_est_counts(inputs, outputs)['total']
+    points = {'ECDSA_SIG': ECDSA_SIG, 'SCHNORR_SIG': SCHNORR_SIG}
+
+    size_dist = weight_dist = (0, [1.0])
+    size_min = size_max = weight_min = weight_max = 0
+    for txout_type, count in inputs.items():
+        if not count:
+            continue
+        input_size, input_weight = part_dist(parse(txout_type), profile, points)
+        size_min += count * input_size[0]
+        size_max += count * (input_size[0] + len(input_size[1]) - 1)
+        weight_min += count * input_weight[0]
+        weight_max += count * (input_weight[0] + len(input_weight[1]) - 1)
+        size_dist = convolve(size_dist, power(input_size, count))
+        weight_dist = convolve(weight_dist, power(input_weight, count))
+
+    res = {'size': summarize(total['size'], size_dist, percentiles),
+           'weight': summarize(total['weight'], weight_dist, percentiles),
+           'vsize': summarize(total['weight'], weight_dist, percentiles, 4)}
+    for metric, lo, hi, scale in (('size', size_min, size_max, 1),
+                                  ('weight', weight_min, weight_max, 1),
+                                  ('vsize', weight_min, weight_max, 4)):
+        base = total['weight'] if metric == 'vsize' else total[metric]
+        res[metric]['min'] = (base + lo) / scale if scale != 1 else base + lo
+        res[metric]['max'] = (base + hi) / scale if scale != 1 else base + hi
+    return res
+
+def _depths(tree, num_leaves):
+    depths = [0] * num_leaves
+    pending = [(tree, 0)]
+    while pending:
+        node, depth = pending.pop()
+        if isinstance(node, tuple):
+            pending.append((node[0], depth + 1))
+            pending.append((node[1], depth + 1))
+        else:
+            depths[node] = depth
+    return depths
+
+def limited_depths(weights, max_depth):
+    # package-merge: leaf depths of a binary tree minimizing the weighted sum
+    # of depths with no leaf deeper than max_depth. Items are (weight, node)
+    # with node a leaf index or a pair of nodes (a package).
+    num_leaves = len(weights)
+    if num_leaves > 2**max_depth:
+        raise ValueError(f'{num_leaves} leaves do not fit into depth {max_depth}')
+    leaf_items = sorted((weight, num) for num, weight in enumerate(weights))
+    items = leaf_items
+    for _ in range(max_depth - 1):
+        packages = [(items[i][0] + items[i+1][0], (items[i][1], items[i+1][1]))
+                    for i in range(0, len(items) - 1, 2)]
+        items = list(heapq.merge(leaf_items, packages, key=lambda item: item[0]))
+    # a leaf's depth is the number of times it occurs in the cheapest
+    # 2n-2 items
+    depths = [0] * num_leaves
+    pending = [node for _, node in items[:2*num_leaves - 2]]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, tuple):
+            pending.extend(node)
+        else:
+            depths[node] += 1
+    return depths
+
+def tree_from_depths(depths):
+    # nested pairs of leaf indices with the given (Kraft-complete) depths
+    by_depth = collections.defaultdict(list)
+    for num, depth in enumerate(depths):
+        by_depth[depth].append(num)
+    level = []
+    for depth in range(max(depths), 0, -1):
+        nodes = by_depth[depth] + level
+        level = [(nodes[i], nodes[i+1]) for i in range(0, len(nodes), 2)]
+    return level[0] if level else by_depth[0][0]
+
+def taptree(leaves):
+    # Tapscript tree minimizing the expected control block size of a
+    # script-path spend, i.e., the probability-weighted number of 32-byte
+    # Merkle path hashes, with no leaf deeper than TAPROOT_MAX_DEPTH. The
+    # compact size of control blocks of depth 7 and more takes 2 extra bytes,
+    # which is not taken into account, so the expected witness weight is
+    # within 2 bytes of the optimum. leaves is a list of dicts with the keys
+    # 'probability' (relative spend probability), 'script' (leaf script
+    # size), and 'stack' (list of stack item sizes). Returns the tree as
+    # nested pairs of leaf indices, and per leaf (in input order) its depth,
+    # witness weight, spend weight (input plus witness), and
+    # probability-weighted contribution to the expected spend weight.
+    if not leaves:
+        raise ValueError('at least one leaf required')
+    total = sum(leaf['probability'] for leaf in leaves)
+    if total <= 0:
+        raise ValueError('leaf probabilities must sum to a positive value')
+
+    # Huffman: (probability, tie breaker, subtree); merging the two least
+    # likely subtrees adds one level (32 bytes of control block) to all their
+    # leaves
+    heap = [(leaf['probability'], num, num) for num, leaf in enumerate(leaves)]
+    heapq.heapify(heap)
+    counter = len(leaves)
+    while len(heap) > 1:
+        prob_a, _, tree_a = heapq.heappop(heap)
+        prob_b, _, tree_b = heapq.heappop(heap)
+        heapq.heappush(heap, (prob_a + prob_b, counter, (tree_a, tree_b)))
+        counter += 1
+    tree = heap[0][2]
+    depths = _depths(tree, len(leaves))
+    if max(depths) > TAPROOT_MAX_DEPTH:
+        # skewed probabilities: fall back to the (slower) optimal
+        # length-limited construction
+        depths = limited_depths([leaf['probability'] for leaf in leaves], TAPROOT_MAX_DEPTH)
+        tree = tree_from_depths(depths)
+
+    input_weight = 4 * (varint(0) + INPUT_OVERHEAD)
+    res = {'tree': tree, 'leaves': [], 'expected_weight': 0.0}
+    for leaf, depth in zip(leaves, depths):
+        witness_weight = tapscript_witness(leaf['script'], depth, leaf['stack'])
+        expected = leaf['probability'] / total * (input_weight + witness_weight)
+        res['leaves'].append({'depth': depth, 'witness_weight': witness_weight,
+                              'spend_weight': input_weight + witness_weight,
+                              'expected_weight': expected})
+        res['expected_weight'] += expected
+    return res
+
+class EstimateArray:
+    # Compact collection of estimates: sizes and weights are packed into two
+    # array('Q') buffers, with NA_VALUE marking not applicable estimates.
+    # Reductions use NumPy views of the buffers if NumPy is available.
+    __slots__ = ('sizes', 'weights')
+    NA_VALUE = 2**64 - 1
+
+    def __init__(self, estimates=()):
+        self.sizes = array.array('Q')
+        self.weights = array.array('Q')
+        self.extend(estimates)
+
+    def append(self, estimate):
+        if estimate['size'] == 'N/A':
+            self.sizes.append(self.NA_VALUE)
+            self.weights.append(self.NA_VALUE)
+        else:
+            self.sizes.append(estimate['size'])
+            self.weights.append(estimate['weight'])
+
+    def extend(self, estimates):
+        for estimate in estimates:
+            self.append(estimate)
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            res = EstimateArray()
+            res.sizes, res.weights = self.sizes[index], self.weights[index]
+            return res
+        size = self.sizes[index]
+        if size == self.NA_VALUE:
+            return Estimate.NA
+        return Estimate(size, self.weights[index])
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def _applicable(self, buffer):
+        if numpy is not None:
+            values = numpy.frombuffer(buffer, dtype=numpy.uint64)
+            return values[values != self.NA_VALUE]
+        return [value for value in buffer if value != self.NA_VALUE]
+
+    def sum(self):
+        # total over all applicable estimates
+        sizes, weights = self._applicable(self.sizes), self._applicable(self.weights)
+        return Estimate(int(sum(sizes) if numpy is None else sizes.sum()),
+                        int(sum(weights) if numpy is None else weights.sum()))
+
+    def max(self):
+        # largest applicable size and weight (from possibly different
+        # estimates), or Estimate.NA if there is none
+        sizes, weights = self._applicable(self.sizes), self._applicable(self.weights)
+        if not len(sizes):
+            return Estimate.NA
+        return Estimate(int(max(sizes) if numpy is None else sizes.max()),
+                        int(max(weights) if numpy is None else weights.max()))